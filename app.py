@@ -3,30 +3,75 @@ Main application file for ArtSwap.
 """
 
 import os
-from flask import Flask, render_template, redirect, url_for, flash, session, g, request, abort
+from datetime import datetime, timedelta
+from flask import (Flask, Response, render_template, redirect, url_for, flash,
+                   session, g, request, abort, jsonify, make_response,
+                   stream_with_context)
 # Debug toolbar import removed to avoid dependency issues
 # from flask_debugtoolbar import DebugToolbarExtension
+from werkzeug.http import is_resource_modified
 from werkzeug.utils import secure_filename
+from sqlalchemy import func, select
 from sqlalchemy.exc import IntegrityError
+import hashlib
+import hmac
 import uuid
 
-from models import db, connect_db, User, ArtPiece, Trade
+from models import db, connect_db, insert_or_ignore, User, ArtPiece, Trade
 from forms import SignupForm, LoginForm, ArtPieceForm, TradeForm
+from events import init_events, publish_trade_event, stream_events
+from jobs import init_jobs, queue_metrics
+from replicas import init_replicas
+from schema import init_schema
+from templating import init_templating
+from compression import init_compression
+from cache import TTLCache
+from provenance import (init_provenance, record_creation, record_transfer,
+                        ownership_chain, ownership_chains)
+from expiry import init_expiry
+from images import init_images, extract_image_metadata, IMAGE_ERRORS
+from importer import init_importer
+from read_models import recent_art_cards, dashboard_panels
+from rollups import init_rollups, site_stats, user_stats
+from idempotency import init_idempotency, idempotent
+from facets import GalleryFilters, facet_counts, date_range_start, DATE_RANGES
+from exports import init_exports, export_chunks, DATASETS, EXPORT_MIMETYPES
 
 CURR_USER_KEY = "curr_user"
 UPLOAD_FOLDER = 'static/uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+ART_PICKER_PAGE_SIZE = 20
+OTHER_ART_LIMIT = 8
+GALLERY_PAGE_SIZE = 24
+STATS_MAX_DAYS = 366
 
 app = Flask(__name__)
 
 # Use SQLite instead of PostgreSQL for easier setup
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///artswap.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Comma-separated read replica URIs; reads from GET requests are sent there
+app.config['SQLALCHEMY_REPLICA_URIS'] = [
+    uri for uri in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if uri
+]
 app.config['SQLALCHEMY_ECHO'] = True
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', "it's a secret")
 # Debug toolbar config removed
 # app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['ALLOWED_EXTENSIONS'] = ALLOWED_EXTENSIONS
+# Use 'database' when running more than one worker process
+app.config['EVENT_BROKER'] = os.environ.get('EVENT_BROKER', 'memory')
+# Report per-template render time in the Server-Timing header
+app.config['TEMPLATE_PROFILING'] = os.environ.get('TEMPLATE_PROFILING') == '1'
+# How long other workers may serve a stale logged-out art page
+app.config['ART_PAGE_CACHE_TTL'] = 60
+app.config['FACET_CACHE_TTL'] = 30
+# Bearer token that lets monitoring read /metrics/jobs without logging in
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+# Pending trade offers older than this are expired by `flask expire-trades`
+app.config['TRADE_PENDING_TTL'] = timedelta(
+    days=int(os.environ.get('TRADE_PENDING_TTL_DAYS', 14)))
 
 # Make sure uploads folder exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -34,9 +79,27 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 # Debug toolbar initialization removed
 # debug = DebugToolbarExtension(app)
 
+init_replicas(app)
 connect_db(app)
-
-# Create tables
+init_events(app)
+init_jobs(app)
+init_templating(app)
+init_compression(app)
+init_provenance(app)
+init_expiry(app)
+init_images(app)
+init_importer(app)
+init_exports(app)
+init_rollups(app)
+init_idempotency(app)
+init_schema(app)
+
+# Rendered art pages for logged-out visitors, keyed by art piece id
+art_page_cache = TTLCache(app.config['ART_PAGE_CACHE_TTL'])
+# Gallery facet counts, keyed by facet and the other active filters
+facet_cache = TTLCache(app.config['FACET_CACHE_TTL'])
+
+# Create tables; existing databases are upgraded with `flask upgrade-db`
 with app.app_context():
     db.create_all()
 
@@ -144,7 +207,7 @@ def home():
     """Show homepage with featured artwork."""
     
     # Get some recent artwork to display
-    recent_art = ArtPiece.query.order_by(ArtPiece.created_at.desc()).limit(8).all()
+    recent_art = recent_art_cards(limit=8)
     
     return render_template('home.html', recent_art=recent_art)
 
@@ -157,34 +220,12 @@ def dashboard():
         flash("Access unauthorized.", "danger")
         return redirect(url_for('login'))
         
-    # Get user's artwork
-    user_art = g.user.art_pieces
-    
-    # Get pending incoming trades
-    incoming_trades = Trade.query.filter_by(
-        receiver_id=g.user.id,
-        status='pending'
-    ).order_by(Trade.created_at.desc()).all()
-    
-    # Get pending outgoing trades
-    outgoing_trades = Trade.query.filter_by(
-        sender_id=g.user.id,
-        status='pending'
-    ).order_by(Trade.created_at.desc()).all()
-    
-    # Get trade history
-    trade_history = Trade.query.filter(
-        ((Trade.sender_id == g.user.id) | (Trade.receiver_id == g.user.id)) &
-        (Trade.status != 'pending')
-    ).order_by(Trade.updated_at.desc()).limit(10).all()
+    panels = dashboard_panels(g.user.id)
     
-    return render_template(
-        'users/dashboard.html',
-        user_art=user_art,
-        incoming_trades=incoming_trades,
-        outgoing_trades=outgoing_trades,
-        trade_history=trade_history
-    )
+    # Ownership history for the traded pieces, in one query
+    provenance = ownership_chains([art.id for art in panels['user_art'] if art.traded])
+    
+    return render_template('users/dashboard.html', provenance=provenance, **panels)
 
 
 ##############################################################################
@@ -210,17 +251,28 @@ def new_art():
             file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
             file.save(file_path)
             
+            try:
+                metadata = extract_image_metadata(file_path)
+            except IMAGE_ERRORS:
+                os.remove(file_path)
+                flash("That file could not be read as an image.", "danger")
+                return render_template('art/new.html', form=form)
+            
             # Create new art piece
             art = ArtPiece(
                 title=form.title.data,
                 description=form.description.data,
                 image_url=file_path,
                 user_id=g.user.id,
-                original_creator_id=g.user.id
+                original_creator_id=g.user.id,
+                **metadata
             )
             
             db.session.add(art)
+            record_creation(art)
             db.session.commit()
+            invalidate_art_pages(user_ids=[g.user.id])
+            facet_cache.clear()
             
             flash("Your artwork has been uploaded!", "success")
             return redirect(url_for('art_detail', id=art.id))
@@ -230,36 +282,167 @@ def new_art():
     return render_template('art/new.html', form=form)
 
 
+def search_own_art(user, query='', page=1):
+    """Return (pieces, has_more) for one page of a user's artwork by title."""
+    
+    stmt = user.art_pieces.select().order_by(ArtPiece.title, ArtPiece.id)
+    if query:
+        stmt = stmt.where(ArtPiece.title.icontains(query, autoescape=True))
+    
+    pieces = db.session.scalars(
+        stmt.offset((page - 1) * ART_PICKER_PAGE_SIZE).limit(ART_PICKER_PAGE_SIZE + 1)
+    ).all()
+    return pieces[:ART_PICKER_PAGE_SIZE], len(pieces) > ART_PICKER_PAGE_SIZE
+
+
+@app.route('/art')
+def gallery():
+    """Browse all artwork, newest first, filtered by creator, trade status or date."""
+    
+    filters = GalleryFilters.from_args(request.args)
+    page = max(request.args.get('page', 1, type=int), 1)
+    art = recent_art_cards(limit=GALLERY_PAGE_SIZE + 1,
+                           offset=(page - 1) * GALLERY_PAGE_SIZE,
+                           criteria=filters.criteria())
+    
+    return render_template('art/gallery.html', art=art[:GALLERY_PAGE_SIZE],
+                           page=page, has_more=len(art) > GALLERY_PAGE_SIZE,
+                           filters=filters, facets=facet_counts(filters, facet_cache),
+                           date_ranges={name: date_range_start(name) for name in DATE_RANGES})
+
+
+@app.route('/art/mine.json')
+def art_search():
+    """Search the current user's artwork for the trade form's picker."""
+    
+    if not g.user:
+        abort(401)
+    
+    page = max(request.args.get('page', 1, type=int), 1)
+    pieces, has_more = search_own_art(g.user, request.args.get('q', '').strip(), page)
+    
+    return jsonify(
+        results=[{'id': piece.id, 'title': piece.title} for piece in pieces],
+        has_more=has_more
+    )
+
+
+def art_page_version(art, viewer=None):
+    """Return (etag, last_modified) covering everything the art page shows.
+    
+    Besides the piece itself, the page lists the rest of the creator's
+    collection and, for logged-in users, depends on who is looking.
+    """
+    
+    collection_size, collection_updated = db.session.query(
+        func.count(ArtPiece.id), func.max(ArtPiece.updated_at)
+    ).filter(ArtPiece.user_id == art.original_creator_id).one()
+    
+    parts = [art.id, art.updated_at, art.original_creator_id,
+             collection_size, collection_updated]
+    if viewer:
+        parts += [viewer.id, viewer.has_art()]
+    
+    etag = hashlib.sha1(repr(parts).encode()).hexdigest()
+    last_modified = max(filter(None, [art.updated_at, collection_updated]), default=None)
+    return etag, last_modified
+
+
+def cacheable_page(html, etag, last_modified, public):
+    """Build a response that browsers revalidate with ETag/Last-Modified."""
+    
+    resp = make_response(html)
+    resp.set_etag(etag)
+    resp.last_modified = last_modified
+    resp.cache_control.no_cache = True
+    if public:
+        resp.cache_control.public = True
+    else:
+        resp.cache_control.private = True
+    return resp.make_conditional(request)
+
+
+def invalidate_art_pages(art_ids=(), user_ids=()):
+    """Drop cached art pages for changed pieces and collections."""
+    
+    art_page_cache.invalidate_tags(
+        *[f"art:{art_id}" for art_id in art_ids],
+        *[f"user:{user_id}" for user_id in user_ids]
+    )
+
+
+def render_art_page(art, can_trade, has_art, trade_form):
+    """Render the art detail page, loading what only the page body needs."""
+    
+    other_art = db.session.scalars(
+        select(ArtPiece)
+        .where(ArtPiece.user_id == art.original_creator_id, ArtPiece.id != art.id)
+        .order_by(ArtPiece.created_at.desc())
+        .limit(OTHER_ART_LIMIT)
+    ).all()
+    
+    return render_template(
+        'art/detail.html',
+        art=art,
+        can_trade=can_trade,
+        has_art=has_art,
+        trade_form=trade_form,
+        other_art=other_art,
+        provenance=ownership_chain(art.id)
+    )
+
+
 @app.route('/art/<int:id>')
 def art_detail(id):
     """Show details of a specific art piece."""
     
+    # Pages carrying flash messages are one-offs and never cached
+    cacheable = not session.get('_flashes')
+    
+    # Logged-out visitors are served from the page cache without a query
+    if cacheable and not g.user:
+        cached = art_page_cache.get(id)
+        if cached:
+            return cacheable_page(*cached, public=True)
+    
     art = ArtPiece.query.get_or_404(id)
     
     # Check if user can offer trades for this piece
-    can_trade = g.user and g.user.id != art.user_id and g.user.art_pieces
+    has_art = g.user and g.user.has_art()
+    can_trade = has_art and g.user.id != art.user_id
     
-    # If user can trade, prepare the trade form
+    # If user can trade, prepare the trade form with the first page of
+    # their collection; the rest is reachable through art_search()
     trade_form = None
     if can_trade:
         trade_form = TradeForm()
         trade_form.sender_art_id.choices = [
-            (piece.id, piece.title) for piece in g.user.art_pieces
+            (piece.id, piece.title) for piece in search_own_art(g.user)[0]
         ]
         trade_form.receiver_art_id.data = art.id
     
-    return render_template(
-        'art/detail.html',
-        art=art,
-        can_trade=can_trade,
-        trade_form=trade_form
-    )
+    # The trade form embeds a time-limited CSRF token, so it is always fresh
+    if not cacheable or trade_form:
+        return render_art_page(art, can_trade, has_art, trade_form)
+    
+    etag, last_modified = art_page_version(art, g.user)
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return cacheable_page('', etag, last_modified, public=not g.user)
+    
+    html = render_art_page(art, can_trade, has_art, trade_form)
+    
+    if not g.user:
+        art_page_cache.set(id, (html, etag, last_modified),
+                           tags=[f"art:{art.id}", f"user:{art.original_creator_id}"])
+    
+    return cacheable_page(html, etag, last_modified, public=not g.user)
 
 
 ##############################################################################
 # Trade routes
 
 @app.route('/trade/new', methods=["POST"])
+@idempotent
 def new_trade():
     """Create a new trade offer."""
     
@@ -268,19 +451,15 @@ def new_trade():
         return redirect(url_for('login'))
     
     form = TradeForm()
-    form.sender_art_id.choices = [
-        (piece.id, piece.title) for piece in g.user.art_pieces
-    ]
     
     if form.validate_on_submit():
         sender_art_id = form.sender_art_id.data
         receiver_art_id = form.receiver_art_id.data
         
         # Validate that the pieces exist and belong to the right users
-        sender_art = ArtPiece.query.get_or_404(sender_art_id)
         receiver_art = ArtPiece.query.get_or_404(receiver_art_id)
         
-        if sender_art.user_id != g.user.id:
+        if not g.user.owns_art(sender_art_id):
             flash("You can only offer your own artwork.", "danger")
             return redirect(url_for('art_detail', id=receiver_art_id))
             
@@ -288,29 +467,24 @@ def new_trade():
             flash("You cannot trade with yourself.", "danger")
             return redirect(url_for('art_detail', id=receiver_art_id))
         
-        # Check if this trade already exists
-        existing_trade = Trade.query.filter_by(
-            sender_id=g.user.id,
-            receiver_id=receiver_art.user_id,
-            sender_art_id=sender_art_id,
-            receiver_art_id=receiver_art_id,
-            status='pending'
-        ).first()
+        # Create the trade, unless the same offer is already pending; the
+        # partial unique index makes this safe against concurrent requests
+        now = datetime.utcnow()
+        trade = insert_or_ignore(Trade, {
+            'sender_id': g.user.id,
+            'receiver_id': receiver_art.user_id,
+            'sender_art_id': sender_art_id,
+            'receiver_art_id': receiver_art_id,
+            'status': 'pending',
+            'created_at': now,
+            'updated_at': now
+        }, ['sender_id', 'receiver_art_id', 'sender_art_id'], where=Trade.status == 'pending')
         
-        if existing_trade:
+        if trade is None:
             flash("You already have a pending trade for this artwork.", "warning")
             return redirect(url_for('art_detail', id=receiver_art_id))
         
-        # Create the trade
-        trade = Trade(
-            sender_id=g.user.id,
-            receiver_id=receiver_art.user_id,
-            sender_art_id=sender_art_id,
-            receiver_art_id=receiver_art_id,
-            status='pending'
-        )
-        
-        db.session.add(trade)
+        publish_trade_event(trade, 'trade.created')
         db.session.commit()
         
         flash("Trade offer sent!", "success")
@@ -321,6 +495,7 @@ def new_trade():
 
 
 @app.route('/trade/<int:id>/accept', methods=["POST"])
+@idempotent
 def accept_trade(id):
     """Accept a pending trade and transfer ownership of art pieces."""
     
@@ -344,6 +519,17 @@ def accept_trade(id):
     sender_art = ArtPiece.query.get_or_404(trade.sender_art_id)
     receiver_art = ArtPiece.query.get_or_404(trade.receiver_art_id)
     
+    # Either piece may have changed hands since the offer was made, e.g.
+    # through another accepted trade; the swap would then move the wrong
+    # pieces and the ledger would record owners they never had
+    if (sender_art.user_id != trade.sender_id or
+            receiver_art.user_id != trade.receiver_id):
+        trade.status = 'expired'
+        publish_trade_event(trade, 'trade.expired')
+        db.session.commit()
+        flash("One of these pieces has changed hands, so this trade has expired.", "warning")
+        return redirect(url_for('dashboard'))
+    
     # Store original creators if not already set
     if not sender_art.original_creator_id:
         sender_art.original_creator_id = sender_art.user_id
@@ -351,6 +537,10 @@ def accept_trade(id):
     if not receiver_art.original_creator_id:
         receiver_art.original_creator_id = receiver_art.user_id
     
+    # Append the swap to both pieces' provenance, from their current owners
+    record_transfer(sender_art, receiver_art.user_id, sender_art.user_id, trade)
+    record_transfer(receiver_art, sender_art.user_id, receiver_art.user_id, trade)
+    
     # Swap the user_id values of the art pieces
     sender_art.user_id, receiver_art.user_id = receiver_art.user_id, sender_art.user_id
     
@@ -360,13 +550,18 @@ def accept_trade(id):
     
     # Update trade status
     trade.status = 'accepted'
+    publish_trade_event(trade, 'trade.accepted')
     db.session.commit()
+    invalidate_art_pages(art_ids=[trade.sender_art_id, trade.receiver_art_id],
+                         user_ids=[trade.sender_id, trade.receiver_id])
+    facet_cache.clear()
     
     flash("Trade accepted! The artwork ownership has been transferred.", "success")
     return redirect(url_for('dashboard'))
 
 
 @app.route('/trade/<int:id>/reject', methods=["POST"])
+@idempotent
 def reject_trade(id):
     """Reject a pending trade."""
     
@@ -388,12 +583,108 @@ def reject_trade(id):
     
     # Update trade status
     trade.status = 'rejected'
+    publish_trade_event(trade, 'trade.rejected')
     db.session.commit()
     
     flash("Trade rejected.", "info")
     return redirect(url_for('dashboard'))
 
 
+@app.route('/events')
+def trade_events():
+    """Stream live trade notifications for the current user (SSE)."""
+    
+    if not g.user:
+        abort(401)
+    
+    last_event_id = (request.headers.get('Last-Event-ID') or
+                     request.args.get('last_event_id'))
+    events = stream_events(g.user.id, last_event_id)
+    
+    # The stream can stay open for hours; don't keep this request's
+    # pooled connection checked out for all of it
+    db.session.remove()
+    
+    return Response(
+        events,
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+##############################################################################
+# Exports
+
+@app.route('/export/<dataset>.<fmt>')
+def export_data(dataset, fmt):
+    """Download the current user's art or trades as NDJSON/CSV, or a ZIP of everything."""
+    
+    if not g.user:
+        abort(401)
+    if fmt == 'zip' and dataset != 'collection':
+        abort(404)
+    if fmt != 'zip' and (dataset not in DATASETS or fmt not in EXPORT_MIMETYPES):
+        abort(404)
+    
+    filename = f"artswap-{g.user.username}-{dataset}.{fmt}"
+    return Response(
+        stream_with_context(export_chunks(g.user.id, fmt, dataset)),
+        mimetype=EXPORT_MIMETYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+
+##############################################################################
+# Admin
+
+
+@app.route('/admin/stats')
+def admin_stats():
+    """Show site-wide trading statistics from the rollup tables."""
+    
+    if not g.user or not g.user.is_admin:
+        flash("Access unauthorized.", "danger")
+        return redirect(url_for('home'))
+    
+    days = min(max(request.args.get('days', 30, type=int), 1), STATS_MAX_DAYS)
+    return render_template('admin/stats.html', stats=site_stats(days), days=days)
+
+
+@app.route('/admin/stats.json')
+def admin_stats_json():
+    """Site-wide, or with ?user=<username> per-user, trading statistics."""
+    
+    if not g.user or not g.user.is_admin:
+        abort(403)
+    
+    days = min(max(request.args.get('days', 30, type=int), 1), STATS_MAX_DAYS)
+    username = request.args.get('user')
+    if username:
+        user = User.query.filter_by(username=username).first_or_404()
+        return jsonify(user=user.username, **user_stats(user.id, days))
+    
+    return jsonify(site_stats(days))
+
+
+##############################################################################
+# Monitoring
+
+@app.route('/metrics/jobs')
+def job_metrics():
+    """Report background job queue depth and latency as JSON.
+    
+    Open to admins, and to scrapers sending METRICS_TOKEN as a bearer token.
+    """
+    
+    token = app.config['METRICS_TOKEN']
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    has_token = bool(token) and hmac.compare_digest(supplied, token)
+    if not has_token and not (g.user and g.user.is_admin):
+        abort(403)
+    
+    return jsonify(queue_metrics())
+
+
 ##############################################################################
 # Error handlers
 
@@ -0,0 +1,144 @@
+"""
+Benchmark the listing-page read models against loading full ORM objects.
+
+Both paths load what the home page and dashboard display; the ORM path
+also touches the relationships its templates used to follow. Runs against
+a throwaway in-memory database. From the project root:
+
+    python benchmarks/bench_read_models.py --art 500 --trades 2000
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert, or_
+from sqlalchemy.pool import StaticPool
+
+from app import app
+from models import db, User, ArtPiece, Trade
+from read_models import dashboard_panels, recent_art_cards
+
+
+def use_memory_database():
+    """Point the default bind at an empty in-memory SQLite database."""
+    db.session.remove()
+    db.engines[None] = create_engine('sqlite://', poolclass=StaticPool)
+    db.create_all()
+
+
+def seed(num_art, num_trades):
+    """Two users with num_art pieces each and num_trades trades between them."""
+
+    collector = User.signup('collector', 'col@example.com', 'password')
+    trader = User.signup('trader', 'trade@example.com', 'password')
+    db.session.commit()
+
+    now = datetime.utcnow()
+    db.session.execute(insert(ArtPiece), [
+        {'title': f'Artwork {i}', 'description': 'A piece of digital art. ' * 20,
+         'image_url': f'static/uploads/art_{i}.jpg',
+         'user_id': owner.id, 'original_creator_id': owner.id,
+         'image_width': 1200, 'image_height': 900, 'dominant_color': '#6b5a4e',
+         'image_placeholder': 'data:image/webp;base64,' + 'A' * 120,
+         'created_at': now - timedelta(minutes=i)}
+        for owner in (collector, trader) for i in range(num_art)
+    ])
+    trades = []
+    pending = set()
+    for i in range(num_trades):
+        sender, receiver = (collector, trader) if i % 2 else (trader, collector)
+        sender_art_id = 1 + i % num_art + (0 if sender is collector else num_art)
+        receiver_art_id = 1 + i % num_art + (num_art if sender is collector else 0)
+        status = ('pending', 'accepted', 'rejected')[i % 3]
+        # Only one pending copy of an offer is allowed (uq_trades_pending_offer)
+        if status == 'pending':
+            offer = (sender.id, sender_art_id, receiver_art_id)
+            if offer in pending:
+                status = 'expired'
+            pending.add(offer)
+        trades.append({
+            'sender_id': sender.id, 'receiver_id': receiver.id,
+            'sender_art_id': sender_art_id, 'receiver_art_id': receiver_art_id,
+            'status': status,
+            'created_at': now - timedelta(minutes=i), 'updated_at': now - timedelta(minutes=i)
+        })
+    db.session.execute(insert(Trade), trades)
+    db.session.commit()
+    return collector.id
+
+
+def orm_home():
+    art = ArtPiece.query.order_by(ArtPiece.created_at.desc()).limit(8).all()
+    return [(piece.title, piece.creator.username) for piece in art]
+
+
+def orm_dashboard(user_id):
+    user = db.session.get(User, user_id)
+    user_art = db.session.scalars(
+        user.art_pieces.select().order_by(ArtPiece.created_at.desc())
+    ).all()
+    trades = (
+        Trade.query.filter_by(receiver_id=user_id, status='pending').all() +
+        Trade.query.filter_by(sender_id=user_id, status='pending').all() +
+        Trade.query.filter(or_(Trade.sender_id == user_id, Trade.receiver_id == user_id),
+                           Trade.status != 'pending')
+        .order_by(Trade.updated_at.desc()).limit(10).all()
+    )
+    return user_art, [
+        (trade.sender.username, trade.receiver.username,
+         trade.offered_art.title, trade.requested_art.title)
+        for trade in trades
+    ]
+
+
+def measure(fn, repeat):
+    """Return (seconds per call, peak bytes allocated by one call)."""
+
+    fn()
+    db.session.remove()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+        db.session.remove()
+    seconds = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    db.session.remove()
+    return seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--art', type=int, default=500)
+    parser.add_argument('--trades', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with app.app_context():
+        use_memory_database()
+        user_id = seed(args.art, args.trades)
+
+        cases = [
+            ('home', orm_home, lambda: recent_art_cards(limit=8)),
+            ('dashboard', lambda: orm_dashboard(user_id),
+             lambda: dashboard_panels(user_id)),
+        ]
+        for name, orm_path, read_model_path in cases:
+            orm_time, orm_peak = measure(orm_path, args.repeat)
+            rm_time, rm_peak = measure(read_model_path, args.repeat)
+            print(f"{name:<10} ORM {orm_time * 1000:8.2f} ms {orm_peak / 1024:8.0f} KiB peak | "
+                  f"read model {rm_time * 1000:8.2f} ms {rm_peak / 1024:8.0f} KiB peak")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark compiling and rendering users/dashboard.html with a large trade list.
+
+Run from the project root:
+
+    python benchmarks/bench_templates.py --trades 2000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import g, render_template
+from jinja2 import FileSystemBytecodeCache
+
+from app import app
+from templating import ProfiledTemplate
+
+
+def make_dashboard_context(num_art, num_trades):
+    """Build dashboard template arguments without touching the database."""
+
+    now = datetime.utcnow()
+    me = SimpleNamespace(id=1, username='collector')
+    other = SimpleNamespace(id=2, username='trader')
+
+    art = [
+        SimpleNamespace(
+            id=i, title=f'Artwork {i}', description='A piece of digital art ' * 5,
+            image_url=f'static/uploads/art_{i}.jpg', traded=i % 3 == 0,
+            original_creator_id=2 if i % 3 == 0 else 1,
+            image_width=1200, image_height=900, dominant_color='#6b5a4e',
+            image_placeholder='data:image/webp;base64,' + 'A' * 120
+        )
+        for i in range(num_art)
+    ]
+
+    def trade(i, sender, receiver, status):
+        return SimpleNamespace(
+            id=i, sender_id=sender.id, receiver_id=receiver.id,
+            sender=sender, receiver=receiver,
+            offered_art=art[i % num_art], requested_art=art[(i + 1) % num_art],
+            is_accepted=status == 'accepted', is_rejected=status == 'rejected',
+            created_at=now, updated_at=now
+        )
+
+    third = max(num_trades // 3, 1)
+    return me, {
+        'user_art': art,
+        'incoming_trades': [trade(i, other, me, 'pending') for i in range(third)],
+        'outgoing_trades': [trade(i, me, other, 'pending') for i in range(third)],
+        'trade_history': [trade(i, me, other, 'accepted') for i in range(third)],
+        'provenance': {
+            piece.id: [SimpleNamespace(owner_username=other.username)]
+            for piece in art if piece.traded
+        },
+    }
+
+
+def time_compile(bytecode_cache):
+    """Seconds to load every template with an empty in-memory cache."""
+    app.jinja_env.cache.clear()
+    app.jinja_env.bytecode_cache = bytecode_cache
+    start = time.perf_counter()
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--art', type=int, default=200)
+    parser.add_argument('--trades', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    me, context = make_dashboard_context(args.art, args.trades)
+
+    configured_cache = app.jinja_env.bytecode_cache
+    with tempfile.TemporaryDirectory() as cache_dir:
+        bytecode_cache = FileSystemBytecodeCache(cache_dir)
+        cold = time_compile(None)
+        time_compile(bytecode_cache)
+        warm = time_compile(bytecode_cache)
+    app.jinja_env.bytecode_cache = configured_cache
+    print(f"compile all templates: {cold * 1000:.1f} ms from source, "
+          f"{warm * 1000:.1f} ms from bytecode cache")
+
+    with app.test_request_context('/dashboard'):
+        g.user = me
+
+        render_template('users/dashboard.html', **context)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            html = render_template('users/dashboard.html', **context)
+        per_render = (time.perf_counter() - start) / args.repeat
+        print(f"render dashboard.html: {per_render * 1000:.2f} ms "
+              f"({len(html) / 1024:.0f} KiB, {args.trades} trades, {args.art} pieces)")
+
+        app.jinja_env.template_class = ProfiledTemplate
+        app.jinja_env.cache.clear()
+        g.template_timings = {}
+        g.template_stack = []
+        render_template('users/dashboard.html', **context)
+        for name, entry in g.template_timings.items():
+            print(f"  {name:<25} {entry['seconds'] * 1000:8.2f} ms  ({entry['calls']} calls)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+In-process caching helpers for ArtSwap.
+"""
+
+import threading
+import time
+
+
+class TTLCache:
+    """Thread-safe in-memory cache with expiry and tag-based invalidation.
+
+    Each worker process has its own copy, so entries in other workers only
+    go away when they expire; keep the TTL short enough for that staleness
+    to be acceptable.
+    """
+
+    def __init__(self, ttl, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = {}
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value, _ = entry
+            if expires < time.monotonic():
+                self._discard(key)
+                return None
+            return value
+
+    def set(self, key, value, tags=()):
+        """Store value under key, remembering tags for invalidation."""
+        with self._lock:
+            if key not in self._entries and len(self._entries) >= self.maxsize:
+                # Drop the entry closest to expiry to make room
+                self._discard(min(self._entries, key=lambda k: self._entries[k][0]))
+            self._discard(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+    def invalidate_tags(self, *tags):
+        """Drop every entry stored with any of the given tags."""
+        with self._lock:
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    self._discard(key)
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
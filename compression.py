@@ -0,0 +1,167 @@
+"""
+Response compression and HTML minification for ArtSwap.
+
+Text responses are compressed with the best encoding the client accepts:
+brotli or zstd when those packages are installed, otherwise gzip. HTML has
+the whitespace between tags stripped first. Images and other already
+compressed bodies, tiny responses and files served straight from disk are
+left alone. Streamed responses are compressed chunk by chunk.
+"""
+
+import re
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/csv',
+    'text/javascript',
+    'application/javascript',
+    'application/json',
+    'application/x-ndjson',
+    'application/xml',
+    'image/svg+xml',
+}
+
+# Whitespace is significant inside these elements
+_PRESERVED_BLOCKS = re.compile(
+    r'(<(pre|textarea|script|style)\b.*?</\2\s*>)', re.DOTALL | re.IGNORECASE)
+# Runs of whitespace between tags still render as one space between
+# inline elements, so they are collapsed rather than removed
+_INTER_TAG_WHITESPACE = re.compile(r'>\s*\n\s*<')
+_INDENTATION = re.compile(r'\n\s+')
+_PLACEHOLDER = re.compile('<\x00(\\d+)\x00>')
+
+
+def minify_html(html):
+    """Collapse indentation and line breaks between tags to single spaces."""
+
+    preserved = []
+
+    def stash(match):
+        preserved.append(match.group(1))
+        return f'<\x00{len(preserved) - 1}\x00>'
+
+    html = _PRESERVED_BLOCKS.sub(stash, html)
+    html = _INDENTATION.sub('\n', _INTER_TAG_WHITESPACE.sub('> <', html))
+    return _PLACEHOLDER.sub(lambda match: preserved[int(match.group(1))], html)
+
+
+def _gzip_compressor(level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress, compressor.flush
+
+
+def _brotli_compressor(level):
+    compressor = brotli.Compressor(quality=level)
+    return compressor.process, compressor.finish
+
+
+def _zstd_compressor(level):
+    compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    return compressor.compress, compressor.flush
+
+
+def available_encodings():
+    """Return supported encodings in order of preference."""
+
+    encodings = {}
+    if brotli is not None:
+        encodings['br'] = _brotli_compressor
+    if zstandard is not None:
+        encodings['zstd'] = _zstd_compressor
+    encodings['gzip'] = _gzip_compressor
+    return encodings
+
+
+def compress_body(data, make_compressor, level):
+    """Compress a complete body."""
+    compress, finish = make_compressor(level)
+    return compress(data) + finish()
+
+
+def compress_stream(chunks, make_compressor, level):
+    """Compress a streamed body as it is produced."""
+    compress, finish = make_compressor(level)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = compress(chunk)
+            if data:
+                yield data
+        yield finish()
+    finally:
+        # Let the wrapped generator run its own cleanup
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def _should_process(response):
+    return (
+        200 <= response.status_code < 300 and
+        response.status_code not in (204, 206) and
+        not response.direct_passthrough and
+        'Content-Encoding' not in response.headers and
+        response.mimetype in COMPRESSIBLE_MIMETYPES
+    )
+
+
+def init_compression(app):
+    """Install the response compression layer."""
+
+    app.config.setdefault('COMPRESS_ENABLED', True)
+    app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+    app.config.setdefault('COMPRESS_MINIFY_HTML', True)
+    # Higher levels trade CPU time for bandwidth
+    app.config.setdefault('COMPRESS_LEVELS', {'br': 4, 'zstd': 3, 'gzip': 6})
+
+    encoders = available_encodings()
+
+    @app.after_request
+    def compress_response(response):
+        """Minify HTML and compress the body for the client."""
+
+        if not app.config['COMPRESS_ENABLED'] or not _should_process(response):
+            return response
+
+        if (app.config['COMPRESS_MINIFY_HTML'] and response.mimetype == 'text/html'
+                and not response.is_streamed):
+            response.set_data(minify_html(response.get_data(as_text=True)))
+
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(list(encoders))
+        if encoding is None:
+            return response
+
+        level = app.config['COMPRESS_LEVELS'][encoding]
+
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoders[encoding], level)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < app.config['COMPRESS_MIN_SIZE']:
+                return response
+            response.set_data(compress_body(data, encoders[encoding], level))
+
+        response.headers['Content-Encoding'] = encoding
+        etag, _ = response.get_etag()
+        if etag:
+            # Weak ETags still satisfy If-None-Match against the original value
+            response.set_etag(etag, weak=True)
+
+        return response
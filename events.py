@@ -0,0 +1,235 @@
+"""
+Live trade notifications for ArtSwap.
+
+Views queue events with publish_trade_event(); they are handed to the
+configured broker only after the surrounding transaction commits, and are
+streamed to browsers as Server-Sent Events.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import event, func, select
+
+from models import db, TradeEvent
+
+PENDING_EVENTS_KEY = 'pending_trade_events'
+
+
+class InProcessBroker:
+    """Broker that keeps recent events in memory.
+
+    Suitable for single-process deployments; every worker process has its
+    own buffer, so use DatabaseBroker when running several workers.
+    """
+
+    def __init__(self, maxlen=1000):
+        self._events = deque(maxlen=maxlen)
+        self._last_id = 0
+        self._cond = threading.Condition()
+
+    def publish(self, user_id, kind, data):
+        """Store an event for a user and wake any waiting streams."""
+        with self._cond:
+            self._last_id += 1
+            self._events.append((self._last_id, user_id, kind, data))
+            self._cond.notify_all()
+            return self._last_id
+
+    def latest_id(self):
+        """Return the id of the newest event published so far."""
+        with self._cond:
+            return self._last_id
+
+    def events_since(self, user_id, last_id):
+        """Return (id, kind, data) tuples for user newer than last_id."""
+        with self._cond:
+            return [(eid, kind, data) for eid, uid, kind, data in self._events
+                    if uid == user_id and eid > last_id]
+
+    def wait(self, user_id, last_id, timeout):
+        """Block up to timeout seconds for events newer than last_id."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                events = self.events_since(user_id, last_id)
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events
+                self._cond.wait(remaining)
+
+
+class DatabaseBroker:
+    """Broker that stores events in the trade_events table.
+
+    Every worker sharing the database sees every event, so this works for
+    multi-worker deployments. Streams poll for new rows.
+    """
+
+    def __init__(self, poll_interval=1.0):
+        self.poll_interval = poll_interval
+
+    def publish(self, user_id, kind, data):
+        """Insert an event row in its own transaction."""
+        with db.engine.begin() as conn:
+            result = conn.execute(
+                TradeEvent.__table__.insert().values(
+                    user_id=user_id,
+                    kind=kind,
+                    payload=json.dumps(data)
+                )
+            )
+            return result.inserted_primary_key[0]
+
+    def latest_id(self):
+        """Return the id of the newest stored event."""
+        with db.engine.connect() as conn:
+            return conn.execute(select(func.max(TradeEvent.id))).scalar() or 0
+
+    def events_since(self, user_id, last_id):
+        """Return (id, kind, data) tuples for user newer than last_id."""
+        stmt = (
+            select(TradeEvent.id, TradeEvent.kind, TradeEvent.payload)
+            .where(TradeEvent.user_id == user_id, TradeEvent.id > last_id)
+            .order_by(TradeEvent.id)
+        )
+        with db.engine.connect() as conn:
+            return [(eid, kind, json.loads(payload))
+                    for eid, kind, payload in conn.execute(stmt)]
+
+    def wait(self, user_id, last_id, timeout):
+        """Poll up to timeout seconds for events newer than last_id."""
+        deadline = time.monotonic() + timeout
+        while True:
+            events = self.events_since(user_id, last_id)
+            remaining = deadline - time.monotonic()
+            if events or remaining <= 0:
+                return events
+            time.sleep(min(self.poll_interval, remaining))
+
+
+BROKERS = {
+    'memory': InProcessBroker,
+    'database': DatabaseBroker,
+}
+
+
+def get_broker():
+    """Return the broker configured for the current app."""
+    return current_app.extensions['trade_events']
+
+
+def publish_trade_event(trade, kind):
+    """Queue a trade event for both parties, sent once the session commits."""
+
+    if trade.id is None:
+        db.session.flush()
+
+    data = {
+        'trade_id': trade.id,
+        'status': trade.status,
+        'sender_id': trade.sender_id,
+        'receiver_id': trade.receiver_id,
+        'sender_art_id': trade.sender_art_id,
+        'receiver_art_id': trade.receiver_art_id,
+    }
+    pending = db.session.info.setdefault(PENDING_EVENTS_KEY, [])
+    for user_id in (trade.sender_id, trade.receiver_id):
+        pending.append((user_id, kind, data))
+
+
+def _flush_pending_events(session):
+    """Hand queued events to the broker after a successful commit."""
+    pending = session.info.pop(PENDING_EVENTS_KEY, None)
+    if pending:
+        broker = get_broker()
+        for user_id, kind, data in pending:
+            broker.publish(user_id, kind, data)
+
+
+def _discard_pending_events(session, previous_transaction=None):
+    """Drop queued events when the transaction is rolled back."""
+    session.info.pop(PENDING_EVENTS_KEY, None)
+
+
+def format_sse(event_id, kind, data):
+    """Format a single event in text/event-stream framing."""
+    return f"id: {event_id}\nevent: {kind}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_events(user_id, last_event_id=None):
+    """Return a generator of SSE frames for a user, with heartbeat comments.
+
+    Events newer than last_event_id are replayed first so a reconnecting
+    browser picks up anything it missed; a fresh connection starts from
+    the newest event instead of replaying history.
+
+    Configuration is read here, so the generator does not need the request
+    context and holds no database connection while it waits.
+    """
+
+    app = current_app._get_current_object()
+    broker = get_broker()
+    heartbeat = app.config['EVENTS_HEARTBEAT_SECONDS']
+    retry = app.config['EVENTS_RETRY_MS']
+
+    try:
+        last_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_id = None
+    if last_id is None:
+        last_id = broker.latest_id()
+
+    def generate(last_id):
+        yield f"retry: {retry}\n\n"
+
+        while True:
+            # DatabaseBroker needs an app context for db.engine; it only
+            # borrows a pooled connection for each short poll
+            with app.app_context():
+                events = broker.wait(user_id, last_id, heartbeat)
+            if not events:
+                yield ": heartbeat\n\n"
+                continue
+            for event_id, kind, data in events:
+                last_id = event_id
+                yield format_sse(event_id, kind, data)
+
+    return generate(last_id)
+
+
+def purge_trade_events(retention):
+    """Delete stored events older than retention; returns how many."""
+
+    cutoff = datetime.utcnow() - retention
+    deleted = TradeEvent.query.filter(TradeEvent.created_at < cutoff).delete()
+    db.session.commit()
+    return deleted
+
+
+def init_events(app):
+    """Set up the event broker and commit hooks for the app."""
+
+    app.config.setdefault('EVENT_BROKER', 'memory')
+    app.config.setdefault('EVENTS_HEARTBEAT_SECONDS', 15)
+    app.config.setdefault('EVENTS_RETRY_MS', 3000)
+    # Stored events only need to outlive a browser's reconnect
+    app.config.setdefault('EVENTS_RETENTION', timedelta(days=1))
+
+    app.extensions['trade_events'] = BROKERS[app.config['EVENT_BROKER']]()
+
+    event.listen(db.session, 'after_commit', _flush_pending_events)
+    event.listen(db.session, 'after_rollback', _discard_pending_events)
+    event.listen(db.session, 'after_soft_rollback', _discard_pending_events)
+
+
+    @app.cli.command('purge-trade-events')
+    def purge_trade_events_command():
+        """Delete stored trade events older than EVENTS_RETENTION."""
+        deleted = purge_trade_events(app.config['EVENTS_RETENTION'])
+        click.echo(f"Deleted {deleted} old trade events")
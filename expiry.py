@@ -0,0 +1,90 @@
+"""
+Expiry of stale pending trades for ArtSwap.
+
+Pending offers older than TRADE_PENDING_TTL are marked expired in small
+batches, each its own short transaction, so the sweep never holds locks
+long enough to get in the way of accept_trade(). Run it from cron with
+`flask expire-trades`, or let the job queue repeat it every
+TRADE_EXPIRY_INTERVAL seconds after `flask expire-trades --schedule`.
+"""
+
+from datetime import datetime
+
+import click
+from flask import current_app
+from sqlalchemy import select, update
+
+from models import db, Trade
+from jobs import job, schedule_recurring
+
+
+def expire_stale_trades(ttl, batch_size=500):
+    """Mark pending trades created more than ttl ago as expired.
+
+    Returns the number of trades expired.
+    """
+
+    cutoff = datetime.utcnow() - ttl
+    total = 0
+
+    while True:
+        batch = (
+            select(Trade.id)
+            .where(Trade.status == 'pending', Trade.created_at < cutoff)
+            .order_by(Trade.created_at)
+            .limit(batch_size)
+        )
+        result = db.session.execute(
+            update(Trade)
+            # Re-check the status in case the trade was answered meanwhile
+            .where(Trade.id.in_(batch.scalar_subquery()), Trade.status == 'pending')
+            .values(status='expired', updated_at=datetime.utcnow()),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+
+        total += result.rowcount
+        if result.rowcount < batch_size:
+            return total
+
+
+def schedule_expiry(delay=0):
+    """Queue the next sweep of stale trades."""
+    return schedule_recurring('trades.expire', current_app.config['TRADE_EXPIRY_INTERVAL'],
+                              delay)
+
+
+@job('trades.expire')
+def expire_trades_job():
+    """Sweep stale trades, then schedule the next sweep."""
+
+    expire_stale_trades(current_app.config['TRADE_PENDING_TTL'],
+                        current_app.config['TRADE_EXPIRY_BATCH_SIZE'])
+    schedule_expiry(delay=current_app.config['TRADE_EXPIRY_INTERVAL'])
+
+
+def init_expiry(app):
+    """Configure trade expiry and register its CLI command."""
+
+    app.config.setdefault('TRADE_EXPIRY_BATCH_SIZE', 500)
+    app.config.setdefault('TRADE_EXPIRY_INTERVAL', 3600)
+
+    @app.cli.command('expire-trades')
+    @click.option('--batch-size', type=int,
+                  help='Trades to expire per transaction.')
+    @click.option('--schedule', is_flag=True,
+                  help='Queue a recurring sweep for the job worker instead.')
+    def expire_trades_command(batch_size, schedule):
+        """Expire pending trades older than TRADE_PENDING_TTL."""
+
+        if schedule:
+            schedule_expiry()
+            db.session.commit()
+            click.echo("Scheduled recurring trade expiry")
+            return
+
+        expired = expire_stale_trades(
+            app.config['TRADE_PENDING_TTL'],
+            batch_size or app.config['TRADE_EXPIRY_BATCH_SIZE']
+        )
+        click.echo(f"Expired {expired} stale trades")
@@ -0,0 +1,191 @@
+"""
+Streaming exports of a user's collection and trade history for ArtSwap.
+
+Rows are read with yield_per, so the database driver hands them over in
+small batches, and written out by generators one line at a time. The ZIP
+variant writes through a buffer that is drained after every write, so a
+collector's whole portfolio never sits in memory at once.
+"""
+
+import csv
+import io
+import json
+import os
+import zipfile
+
+import click
+from flask import current_app
+from sqlalchemy import or_, select
+from sqlalchemy.orm import aliased
+
+from models import db, User, ArtPiece, Trade
+
+# Rows fetched from the database per round trip
+EXPORT_BATCH_SIZE = 500
+# Bytes read from an image file per write into the archive
+IMAGE_CHUNK_SIZE = 64 * 1024
+
+EXPORT_MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'zip': 'application/zip',
+}
+
+
+def art_rows(user_id):
+    """Yield a dict per art piece the user owns."""
+
+    creator = aliased(User)
+    stmt = (
+        select(ArtPiece.id, ArtPiece.title, ArtPiece.description, ArtPiece.image_url,
+               ArtPiece.image_width, ArtPiece.image_height, ArtPiece.image_format,
+               creator.username.label('original_creator'), ArtPiece.traded,
+               ArtPiece.created_at)
+        .outerjoin(creator, creator.id == ArtPiece.original_creator_id)
+        .where(ArtPiece.user_id == user_id)
+        .order_by(ArtPiece.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    for row in db.session.execute(stmt):
+        yield row._asdict()
+
+
+def trade_rows(user_id):
+    """Yield a dict per trade the user sent or received."""
+
+    sender, receiver = aliased(User), aliased(User)
+    sender_art, receiver_art = aliased(ArtPiece), aliased(ArtPiece)
+    stmt = (
+        select(Trade.id, Trade.status,
+               sender.username.label('sender'), receiver.username.label('receiver'),
+               Trade.sender_art_id, sender_art.title.label('sender_art_title'),
+               Trade.receiver_art_id, receiver_art.title.label('receiver_art_title'),
+               Trade.created_at, Trade.updated_at)
+        .join(sender, sender.id == Trade.sender_id)
+        .join(receiver, receiver.id == Trade.receiver_id)
+        .join(sender_art, sender_art.id == Trade.sender_art_id)
+        .join(receiver_art, receiver_art.id == Trade.receiver_art_id)
+        .where(or_(Trade.sender_id == user_id, Trade.receiver_id == user_id))
+        .order_by(Trade.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    for row in db.session.execute(stmt):
+        yield row._asdict()
+
+
+DATASETS = {
+    'art': art_rows,
+    'trades': trade_rows,
+}
+
+
+def _jsonable(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def ndjson_lines(rows):
+    """Encode rows as newline-delimited JSON."""
+    for row in rows:
+        yield json.dumps({key: _jsonable(value) for key, value in row.items()}) + '\n'
+
+
+def csv_lines(rows):
+    """Encode rows as CSV, with a header taken from the first row."""
+
+    line = io.StringIO()
+    writer = None
+    for row in rows:
+        if writer is None:
+            writer = csv.DictWriter(line, fieldnames=list(row))
+            writer.writeheader()
+        writer.writerow({key: _jsonable(value) for key, value in row.items()})
+        yield line.getvalue()
+        line.seek(0)
+        line.truncate()
+
+
+class _DrainingBuffer(io.RawIOBase):
+    """Write-only, non-seekable sink whose contents are taken by drain()."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+def zip_chunks(user_id):
+    """Yield a ZIP archive of the user's art, trades and image files."""
+
+    buffer = _DrainingBuffer()
+    # zipfile notices the buffer cannot seek and writes data descriptors
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for dataset, rows in DATASETS.items():
+            with archive.open(f'{dataset}.ndjson', 'w') as member:
+                for line in ndjson_lines(rows(user_id)):
+                    member.write(line.encode('utf-8'))
+                    yield from buffer.drain()
+
+        for art in art_rows(user_id):
+            path = os.path.join(current_app.root_path, art['image_url'])
+            if not os.path.isfile(path):
+                continue
+            info = zipfile.ZipInfo.from_file(
+                path, f"images/{art['id']}-{os.path.basename(path)}")
+            # Images are already compressed
+            info.compress_type = zipfile.ZIP_STORED
+            with open(path, 'rb') as image, archive.open(info, 'w') as member:
+                for chunk in iter(lambda: image.read(IMAGE_CHUNK_SIZE), b''):
+                    member.write(chunk)
+                    yield from buffer.drain()
+
+    yield from buffer.drain()
+
+
+def export_chunks(user_id, fmt, dataset='art'):
+    """Yield the export of one dataset (or everything, for zip) as bytes."""
+
+    if fmt == 'zip':
+        yield from zip_chunks(user_id)
+        return
+
+    encode = ndjson_lines if fmt == 'ndjson' else csv_lines
+    for line in encode(DATASETS[dataset](user_id)):
+        yield line.encode('utf-8')
+
+
+def init_exports(app):
+    """Register the user export CLI command."""
+
+    @app.cli.command('export-user')
+    @click.argument('username')
+    @click.option('--format', 'fmt', type=click.Choice(list(EXPORT_MIMETYPES)),
+                  default='ndjson', show_default=True)
+    @click.option('--dataset', type=click.Choice(list(DATASETS)), default='art',
+                  show_default=True, help='Ignored for zip, which has everything.')
+    # Not stdout: with SQLALCHEMY_ECHO the SQL log would be mixed into it
+    @click.option('-o', '--output', required=True,
+                  type=click.Path(dir_okay=False, writable=True),
+                  help='File to write.')
+    def export_user_command(username, fmt, dataset, output):
+        """Export a user's collection or trade history."""
+
+        if output == '-':
+            raise click.BadParameter("stdout is not supported; give a file name",
+                                     param_hint="'--output'")
+
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.ClickException(f"No such user: {username}")
+
+        with open(output, 'wb') as f:
+            for chunk in export_chunks(user.id, fmt, dataset):
+                f.write(chunk)
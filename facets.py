@@ -0,0 +1,154 @@
+"""
+Gallery filters and facet counts for ArtSwap.
+
+The gallery can be narrowed by original creator, traded versus original
+pieces, and upload date. Next to each filter it shows how many pieces
+each choice would leave. Those counts are GROUP BY queries over
+art_pieces, so they are cached briefly per combination of the other
+filters. The cache is cleared whenever new art arrives or a trade moves
+pieces.
+"""
+
+from datetime import date, datetime, time, timedelta
+from typing import NamedTuple, Optional
+
+from sqlalchemy import case, func, select
+
+from models import db, User, ArtPiece
+
+# Creators listed in the creator facet
+FACET_CREATOR_LIMIT = 20
+
+# Upload date shortcuts: name -> days back from today
+DATE_RANGES = {
+    'week': 7,
+    'month': 30,
+    'year': 365,
+}
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+class GalleryFilters(NamedTuple):
+    """Normalized gallery filters; also the facet cache key."""
+    creator: Optional[str] = None
+    traded: Optional[bool] = None
+    since: Optional[date] = None
+    until: Optional[date] = None
+
+    @classmethod
+    def from_args(cls, args):
+        """Read filters from query arguments, ignoring invalid values."""
+        return cls(
+            creator=(args.get('creator') or '').strip() or None,
+            traded={'yes': True, 'no': False}.get(args.get('traded')),
+            since=_parse_date(args.get('since')),
+            until=_parse_date(args.get('until')),
+        )
+
+    def to_args(self, **changes):
+        """Query arguments for these filters, with some replaced."""
+
+        filters = self._replace(**changes)
+        args = {
+            'creator': filters.creator,
+            'traded': None if filters.traded is None else ('yes' if filters.traded else 'no'),
+            'since': filters.since and filters.since.isoformat(),
+            'until': filters.until and filters.until.isoformat(),
+        }
+        return {name: value for name, value in args.items() if value is not None}
+
+    @property
+    def active(self):
+        return any(value is not None for value in self)
+
+    def criteria(self):
+        """WHERE clauses selecting the pieces these filters allow."""
+
+        clauses = []
+        if self.creator is not None:
+            clauses.append(ArtPiece.original_creator_id == select(User.id).where(
+                User.username == self.creator).scalar_subquery())
+        if self.traded is not None:
+            clauses.append(ArtPiece.traded == self.traded)
+        if self.since is not None:
+            clauses.append(ArtPiece.created_at >= datetime.combine(self.since, time.min))
+        if self.until is not None:
+            clauses.append(ArtPiece.created_at <
+                           datetime.combine(self.until + timedelta(days=1), time.min))
+        return clauses
+
+
+def _creator_counts(filters):
+    count = func.count(ArtPiece.id)
+    rows = db.session.execute(
+        select(User.username, count)
+        .join(User, User.id == ArtPiece.original_creator_id)
+        .where(*filters.criteria())
+        .group_by(User.id, User.username)
+        .order_by(count.desc(), User.username)
+        .limit(FACET_CREATOR_LIMIT)
+    ).all()
+    return [tuple(row) for row in rows]
+
+
+def _traded_counts(filters):
+    rows = db.session.execute(
+        select(ArtPiece.traded, func.count(ArtPiece.id))
+        .where(*filters.criteria())
+        .group_by(ArtPiece.traded)
+    ).all()
+    counts = {'traded': 0, 'original': 0}
+    for traded, count in rows:
+        counts['traded' if traded else 'original'] += count
+    return counts
+
+
+def _date_counts(filters):
+    today = datetime.combine(date.today(), time.min)
+    windows = [
+        func.coalesce(func.sum(case(
+            (ArtPiece.created_at >= today - timedelta(days=days - 1), 1), else_=0
+        )), 0)
+        for days in DATE_RANGES.values()
+    ]
+    row = db.session.execute(
+        select(*windows, func.count(ArtPiece.id)).where(*filters.criteria())
+    ).one()
+    return {**dict(zip(DATE_RANGES, row)), 'all': row[-1]}
+
+
+def _cached(cache, name, filters, compute):
+    key = (name, filters)
+    counts = cache.get(key)
+    if counts is None:
+        counts = compute(filters)
+        cache.set(key, counts)
+    return counts
+
+
+def facet_counts(filters, cache):
+    """Counts for each facet, given the other active filters.
+
+    A facet's own filter is left out of its counts, so every option shows
+    how many pieces choosing it would give.
+    """
+
+    return {
+        'creators': _cached(cache, 'creators', filters._replace(creator=None),
+                            _creator_counts),
+        'traded': _cached(cache, 'traded', filters._replace(traded=None),
+                          _traded_counts),
+        'dates': _cached(cache, 'dates', filters._replace(since=None, until=None),
+                         _date_counts),
+    }
+
+
+def date_range_start(name):
+    """First day of a DATE_RANGES shortcut."""
+    return date.today() - timedelta(days=DATE_RANGES[name] - 1)
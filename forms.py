@@ -60,7 +60,10 @@ class ArtPieceForm(FlaskForm):
 class TradeForm(FlaskForm):
     """Form for creating a trade offer."""
     
-    sender_art_id = SelectField('Your Artwork', coerce=int, validators=[DataRequired()])
+    # Choices hold only the first page of the user's collection; ownership
+    # of the submitted piece is checked in the view
+    sender_art_id = SelectField('Your Artwork', coerce=int, choices=[], validate_choice=False,
+                                validators=[DataRequired()])
     
     receiver_art_id = HiddenField('Their Artwork', validators=[DataRequired()])
     
@@ -0,0 +1,137 @@
+"""
+Idempotency-Key support for ArtSwap's trade POSTs.
+
+A client that may retry a request (a double-click, a flaky connection)
+sends an Idempotency-Key header. The first request with a given key
+claims it by inserting a placeholder row before the view runs; when the
+view finishes, its status, Location and body are stored on that row.
+A retry with the same key then gets the stored response back without
+the view running again. A retry that arrives while the first request is
+still running gets 409, and reusing a key for a different request gets
+422.
+"""
+
+import hashlib
+from datetime import datetime, timedelta
+from functools import wraps
+
+import click
+from flask import Response, current_app, g, request, abort
+
+from models import db, IdempotencyKey, insert_or_ignore
+
+MAX_KEY_LENGTH = IdempotencyKey.key.type.length
+
+
+def request_fingerprint():
+    """Hash of what makes a request 'the same': method, path and form."""
+
+    form = sorted((name, value) for name, value in request.form.items(multi=True)
+                  if name != 'csrf_token')
+    digest = hashlib.sha256(f"{request.method} {request.path}\n{form!r}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _claim(key, fingerprint):
+    """Insert the placeholder for key; returns it, or the row already there."""
+
+    values = {'user_id': g.user.id, 'key': key, 'fingerprint': fingerprint,
+              'created_at': datetime.utcnow()}
+    claimed = insert_or_ignore(IdempotencyKey, values, ['user_id', 'key'])
+    if claimed is not None:
+        db.session.commit()
+        return claimed, True
+
+    existing = IdempotencyKey.query.filter_by(user_id=g.user.id, key=key).one()
+    age = datetime.utcnow() - existing.created_at
+    stale = (age > current_app.config['IDEMPOTENCY_KEY_TTL'] or
+             existing.in_progress and
+             age.total_seconds() > current_app.config['IDEMPOTENCY_IN_PROGRESS_TIMEOUT'])
+    if not stale:
+        return existing, False
+
+    # Expired, or left behind by a request that died; start over
+    db.session.delete(existing)
+    db.session.flush()
+    claimed = insert_or_ignore(IdempotencyKey, values, ['user_id', 'key'])
+    db.session.commit()
+    if claimed is None:
+        return IdempotencyKey.query.filter_by(user_id=g.user.id, key=key).one(), False
+    return claimed, True
+
+
+def _replay(record):
+    response = Response(record.response_body, status=record.response_status)
+    if record.response_location:
+        response.headers['Location'] = record.response_location
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """Make a POST view safe to retry with an Idempotency-Key header.
+
+    Requests without the header, or from logged-out users, run as usual.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key or not g.user:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            abort(400)
+
+        fingerprint = request_fingerprint()
+        record, claimed = _claim(key, fingerprint)
+        if not claimed:
+            if record.fingerprint != fingerprint:
+                abort(422)
+            if record.in_progress:
+                abort(409)
+            return _replay(record)
+
+        record_id = record.id
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            IdempotencyKey.query.filter_by(id=record_id).delete()
+            db.session.commit()
+            raise
+
+        # Anything the view left uncommitted would be discarded at teardown
+        db.session.rollback()
+        if response.status_code >= 500:
+            # Let a retry do the work again
+            IdempotencyKey.query.filter_by(id=record_id).delete()
+        else:
+            record = db.session.get(IdempotencyKey, record_id)
+            record.response_status = response.status_code
+            record.response_location = response.headers.get('Location')
+            record.response_body = response.get_data(as_text=True)
+        db.session.commit()
+        return response
+
+    return wrapper
+
+
+def purge_idempotency_keys():
+    """Delete stored responses older than IDEMPOTENCY_KEY_TTL; returns how many."""
+
+    cutoff = datetime.utcnow() - current_app.config['IDEMPOTENCY_KEY_TTL']
+    deleted = IdempotencyKey.query.filter(IdempotencyKey.created_at < cutoff).delete()
+    db.session.commit()
+    return deleted
+
+
+def init_idempotency(app):
+    """Configure idempotency keys and register their CLI command."""
+
+    app.config.setdefault('IDEMPOTENCY_KEY_TTL', timedelta(hours=24))
+    app.config.setdefault('IDEMPOTENCY_IN_PROGRESS_TIMEOUT', 60)
+
+    @app.cli.command('purge-idempotency-keys')
+    def purge_idempotency_keys_command():
+        """Delete stored responses for expired idempotency keys."""
+        click.echo(f"Deleted {purge_idempotency_keys()} expired idempotency keys")
@@ -0,0 +1,137 @@
+"""
+Image metadata and low-quality placeholders for ArtSwap uploads.
+
+Pillow is optional: without it only the file size is recorded, and pages
+fall back to loading images without reserved space or placeholders.
+"""
+
+import base64
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+from flask import current_app
+from sqlalchemy import select, update
+
+from models import db, ArtPiece
+
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+
+# What extract_image_metadata() raises for files that are not usable
+# images; DecompressionBombError is not an OSError
+if Image is None:
+    IMAGE_ERRORS = (OSError,)
+else:
+    IMAGE_ERRORS = (OSError, ValueError, Image.DecompressionBombError)
+
+# Longest side of the inline placeholder, in pixels
+PLACEHOLDER_SIZE = 16
+
+
+def _dominant_color(img):
+    """Return the most common colour of a small RGB image as #rrggbb."""
+    quantized = img.quantize(colors=8)
+    palette = quantized.getpalette()
+    _, index = max(quantized.getcolors())
+    r, g, b = palette[index * 3:index * 3 + 3]
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def _placeholder(img):
+    """Encode a tiny copy of the image as a data URI."""
+    img.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    fmt = 'WEBP' if features.check('webp') else 'PNG'
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, quality=40)
+    encoded = base64.b64encode(buffer.getvalue()).decode('ascii')
+    return f"data:image/{fmt.lower()};base64,{encoded}"
+
+
+def extract_image_metadata(path):
+    """Return ArtPiece image column values for the file at path.
+
+    Raises one of IMAGE_ERRORS if the file is missing, is not a readable
+    image or is too large to decode safely.
+    """
+
+    metadata = {'image_bytes': os.path.getsize(path)}
+    if Image is None:
+        return metadata
+
+    with Image.open(path) as img:
+        metadata['image_width'], metadata['image_height'] = img.size
+        metadata['image_format'] = img.format.lower()
+        # Let JPEG decode at reduced size; we only need a few pixels
+        img.draft('RGB', (PLACEHOLDER_SIZE * 4, PLACEHOLDER_SIZE * 4))
+        small = img.convert('RGB')
+
+    small.thumbnail((PLACEHOLDER_SIZE * 4, PLACEHOLDER_SIZE * 4))
+    metadata['dominant_color'] = _dominant_color(small)
+    metadata['image_placeholder'] = _placeholder(small)
+    return metadata
+
+
+def _backfill_one(job):
+    """Worker-process helper: (art_id, path) -> (art_id, metadata or None)."""
+    art_id, path = job
+    try:
+        return art_id, extract_image_metadata(path)
+    except IMAGE_ERRORS:
+        return art_id, None
+
+
+def backfill_image_metadata(workers=None, batch_size=200):
+    """Extract metadata for pieces that have none, using a process pool.
+
+    Each batch is committed as it completes, so an interrupted run resumes
+    with the pieces still missing metadata. Returns (updated, failed).
+    """
+
+    root = current_app.root_path
+    updated = failed = 0
+    last_id = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            rows = db.session.execute(
+                select(ArtPiece.id, ArtPiece.image_url)
+                .where(ArtPiece.image_bytes.is_(None), ArtPiece.id > last_id)
+                .order_by(ArtPiece.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                return updated, failed
+
+            jobs = [(art_id, os.path.join(root, image_url)) for art_id, image_url in rows]
+            values = []
+            for art_id, metadata in pool.map(_backfill_one, jobs):
+                if metadata is None:
+                    failed += 1
+                else:
+                    values.append({'id': art_id, **metadata})
+
+            if values:
+                db.session.execute(update(ArtPiece), values)
+            db.session.commit()
+
+            updated += len(values)
+            last_id = rows[-1].id
+            click.echo(f"  processed up to art #{last_id}: {updated} updated, {failed} unreadable")
+
+
+def init_images(app):
+    """Register the image metadata CLI command."""
+
+    @app.cli.command('backfill-image-metadata')
+    @click.option('--workers', type=int, help='Worker processes (default: CPU count).')
+    @click.option('--batch-size', default=200, show_default=True)
+    def backfill_image_metadata_command(workers, batch_size):
+        """Extract size, colour and placeholder for existing uploads."""
+        if Image is None:
+            click.echo("Pillow is not installed; only file sizes will be recorded.")
+        updated, failed = backfill_image_metadata(workers, batch_size)
+        click.echo(f"Updated {updated} art pieces; {failed} images could not be read")
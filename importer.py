@@ -0,0 +1,244 @@
+"""
+Bulk import of artwork for ArtSwap.
+
+`flask import-art SOURCE --user NAME` reads a manifest (CSV or JSONL with
+file, title and description fields) describing images in a directory or
+a zip/tar archive. Images are hashed, validated and copied into the
+upload folder by a pool of worker processes; rows are inserted in batches
+along with their provenance ledger entries.
+
+Uploaded files are named by content hash, so re-running an interrupted
+import skips pieces the user already has instead of duplicating them.
+"""
+
+import csv
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+import click
+from flask import current_app
+from sqlalchemy import insert, select
+
+from models import db, User, ArtPiece, OwnershipEvent
+from images import extract_image_metadata, IMAGE_ERRORS
+
+MANIFEST_NAMES = ('manifest.csv', 'manifest.jsonl')
+TITLE_MAX_LENGTH = ArtPiece.title.type.length
+
+
+class ImportSourceError(Exception):
+    """Raised for problems with the import source or manifest."""
+
+
+def read_manifest(path):
+    """Return the manifest entries at path as a list of dicts."""
+
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            entries = [json.loads(line) for line in f if line.strip()]
+        elif path.endswith('.csv'):
+            entries = list(csv.DictReader(f))
+        else:
+            raise ImportSourceError(f"Manifest must be .csv or .jsonl: {path}")
+
+    for number, entry in enumerate(entries, start=1):
+        if not entry.get('file'):
+            raise ImportSourceError(f"Manifest entry {number} has no 'file'")
+    return entries
+
+
+def extract_archive(source, target):
+    """Unpack a zip or tar archive into the target directory."""
+
+    if zipfile.is_zipfile(source):
+        # zipfile drops absolute paths and '..' components itself
+        with zipfile.ZipFile(source) as archive:
+            archive.extractall(target)
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source) as archive:
+            # The 'data' filter refuses links and paths outside target
+            archive.extractall(target, filter='data')
+    else:
+        raise ImportSourceError(f"Not a directory, zip or tar archive: {source}")
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _prepare_image(task):
+    """Worker-process step: validate one entry and copy its image.
+
+    Returns a dict of ArtPiece column values, or {'error': message}.
+    """
+
+    source, upload_folder, dest_dir, extensions, entry = task
+    name = entry['file']
+
+    path = os.path.realpath(os.path.join(source, name))
+    if not path.startswith(source + os.sep):
+        return {'error': f"{name}: outside the import source"}
+
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension not in extensions:
+        return {'error': f"{name}: not an allowed image type"}
+
+    title = (entry.get('title') or os.path.splitext(os.path.basename(name))[0]).strip()
+    if len(title) > TITLE_MAX_LENGTH:
+        return {'error': f"{name}: title longer than {TITLE_MAX_LENGTH} characters"}
+
+    try:
+        metadata = extract_image_metadata(path)
+        filename = f"{_file_digest(path)[:32]}.{extension}"
+        dest = os.path.join(dest_dir, filename)
+        if not os.path.exists(dest):
+            # Copy under a temporary name so a crash never leaves half a file
+            partial = f"{dest}.{os.getpid()}.part"
+            shutil.copyfile(path, partial)
+            os.replace(partial, dest)
+    except IMAGE_ERRORS as e:
+        return {'error': f"{name}: {getattr(e, 'strerror', None) or 'not a readable image'}"}
+
+    return {
+        'title': title,
+        'description': entry.get('description') or None,
+        'image_url': os.path.join(upload_folder, filename),
+        **metadata
+    }
+
+
+def insert_batch(user_id, prepared):
+    """Insert prepared pieces the user does not already have.
+
+    Returns the number of pieces inserted.
+    """
+
+    existing = set(db.session.scalars(
+        select(ArtPiece.image_url).where(
+            ArtPiece.user_id == user_id,
+            ArtPiece.image_url.in_({piece['image_url'] for piece in prepared})
+        )
+    ))
+
+    rows = []
+    for piece in prepared:
+        if piece['image_url'] not in existing:
+            existing.add(piece['image_url'])
+            rows.append({**piece, 'user_id': user_id, 'original_creator_id': user_id})
+
+    if rows:
+        art_ids = db.session.scalars(insert(ArtPiece).returning(ArtPiece.id), rows).all()
+        now = datetime.utcnow()
+        db.session.execute(insert(OwnershipEvent), [
+            {'art_id': art_id, 'seq': 1, 'owner_id': user_id,
+             'kind': 'created', 'created_at': now}
+            for art_id in art_ids
+        ])
+    db.session.commit()
+    return len(rows)
+
+
+@contextmanager
+def open_source(source):
+    """Yield a directory holding the import source, unpacking archives."""
+
+    if os.path.isdir(source):
+        yield os.path.realpath(source)
+        return
+
+    with tempfile.TemporaryDirectory(prefix='artswap-import-') as tmp:
+        extract_archive(source, tmp)
+        yield os.path.realpath(tmp)
+
+
+def find_manifest(root, manifest=None):
+    """Return the manifest path, defaulting to manifest.csv/.jsonl in root."""
+
+    if manifest:
+        return manifest
+    for name in MANIFEST_NAMES:
+        path = os.path.join(root, name)
+        if os.path.exists(path):
+            return path
+    raise ImportSourceError("No manifest given and none found in the source")
+
+
+def import_entries(root, entries, user, workers=None, batch_size=500, progress=None):
+    """Import manifest entries whose files live under root for user.
+
+    progress, if given, is called with 1 as each entry is processed.
+    Returns (imported, skipped, errors) where errors is a list of messages.
+    """
+
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    dest_dir = os.path.join(current_app.root_path, upload_folder)
+    os.makedirs(dest_dir, exist_ok=True)
+    extensions = current_app.config['ALLOWED_EXTENSIONS']
+    tasks = [(root, upload_folder, dest_dir, extensions, entry) for entry in entries]
+
+    imported = 0
+    errors = []
+    batch = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for result in pool.map(_prepare_image, tasks, chunksize=16):
+            if 'error' in result:
+                errors.append(result['error'])
+            else:
+                batch.append(result)
+            if len(batch) >= batch_size:
+                imported += insert_batch(user.id, batch)
+                batch = []
+            if progress:
+                progress(1)
+    if batch:
+        imported += insert_batch(user.id, batch)
+
+    skipped = len(entries) - imported - len(errors)
+    return imported, skipped, errors
+
+
+def init_importer(app):
+    """Register the bulk import CLI command."""
+
+    @app.cli.command('import-art')
+    @click.argument('source', type=click.Path(exists=True))
+    @click.option('--user', 'username', required=True, help='Artist who will own the pieces.')
+    @click.option('--manifest', type=click.Path(exists=True, dir_okay=False),
+                  help='CSV or JSONL manifest (default: manifest.csv/.jsonl in SOURCE).')
+    @click.option('--workers', type=int, help='Worker processes (default: CPU count).')
+    @click.option('--batch-size', default=500, show_default=True)
+    def import_art_command(source, username, manifest, workers, batch_size):
+        """Import a directory or zip/tar archive of artwork."""
+
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.ClickException(f"No such user: {username}")
+
+        try:
+            with open_source(source) as root:
+                entries = read_manifest(find_manifest(root, manifest))
+                with click.progressbar(length=len(entries), label='Importing artwork') as bar:
+                    imported, skipped, errors = import_entries(
+                        root, entries, user, workers, batch_size, progress=bar.update
+                    )
+        except ImportSourceError as e:
+            raise click.ClickException(str(e))
+
+        for message in errors[:20]:
+            click.echo(f"  skipped {message}", err=True)
+        if len(errors) > 20:
+            click.echo(f"  ... and {len(errors) - 20} more", err=True)
+        click.echo(f"Imported {imported} pieces; {skipped} already present; "
+                   f"{len(errors)} invalid")
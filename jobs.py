@@ -0,0 +1,337 @@
+"""
+Durable background job queue for ArtSwap.
+
+Jobs are rows in the jobs table. enqueue() adds the row to the current
+session, so a job only exists if the request transaction that created it
+commits. Workers started with `flask worker` claim due jobs one at a time,
+retry failures with exponential backoff and give up after max_attempts.
+Every JOBS_MAINTENANCE_SECONDS each worker also requeues jobs left
+running by a worker that died and deletes finished jobs older than
+JOBS_DONE_RETENTION.
+"""
+
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import random
+import socket
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Job
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+HANDLERS = {}
+
+
+def job(name):
+    """Register a function as the handler for jobs called name."""
+
+    def decorator(func):
+        HANDLERS[name] = func
+        return func
+
+    return decorator
+
+
+def enqueue(name, payload=None, dedupe_key=None, delay=0, max_attempts=None):
+    """Queue a job in the current transaction and return it.
+
+    Nothing runs until the caller commits. If an unfinished job with the
+    same dedupe_key already exists, that job is returned instead.
+    """
+
+    if dedupe_key is not None:
+        existing = Job.query.filter(
+            Job.dedupe_key == dedupe_key,
+            Job.status.in_(ACTIVE_STATUSES)
+        ).first()
+        if existing:
+            return existing
+
+    new_job = Job(
+        name=name,
+        payload=json.dumps(payload or {}),
+        dedupe_key=dedupe_key,
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+        max_attempts=max_attempts or current_app.config['JOBS_MAX_ATTEMPTS']
+    )
+
+    if dedupe_key is None or db.session.get_bind().dialect.name == 'sqlite':
+        # pysqlite cannot nest a SAVEPOINT inside the request transaction;
+        # SQLite serialises writers, and the unique index still backs the check
+        db.session.add(new_job)
+        return new_job
+
+    try:
+        with db.session.begin_nested():
+            db.session.add(new_job)
+    except IntegrityError:
+        # Another transaction queued the same key after our check
+        return Job.query.filter(
+            Job.dedupe_key == dedupe_key,
+            Job.status.in_(ACTIVE_STATUSES)
+        ).first()
+
+    return new_job
+
+
+def schedule_recurring(name, interval, delay=0):
+    """Queue the next run of a job that repeats every interval seconds.
+
+    The dedupe key names the interval the run falls in, so however many
+    times this is called, each interval gets one job.
+    """
+
+    run_at = datetime.utcnow().timestamp() + delay
+    return enqueue(name, dedupe_key=f"{name}:{int(run_at // interval)}", delay=delay)
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt, with a little jitter."""
+    base = current_app.config['JOBS_RETRY_BASE_SECONDS']
+    cap = current_app.config['JOBS_RETRY_MAX_SECONDS']
+    delay = min(base * 2 ** (attempts - 1), cap)
+    return delay * random.uniform(0.9, 1.1)
+
+
+def requeue_stale_jobs():
+    """Put back jobs whose worker died while running them."""
+    cutoff = datetime.utcnow() - timedelta(
+        seconds=current_app.config['JOBS_LOCK_TIMEOUT_SECONDS'])
+    db.session.execute(
+        update(Job)
+        .where(Job.status == 'running', Job.locked_at < cutoff)
+        .values(status='queued', locked_by=None, locked_at=None),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+
+
+def purge_finished_jobs(retention, batch_size=1000):
+    """Delete jobs that finished successfully more than retention ago.
+
+    Returns the number of jobs deleted.
+    """
+
+    cutoff = datetime.utcnow() - retention
+    total = 0
+
+    while True:
+        batch = (
+            select(Job.id)
+            .where(Job.status == 'done', Job.finished_at < cutoff)
+            .limit(batch_size)
+        )
+        result = db.session.execute(
+            delete(Job).where(Job.id.in_(batch.scalar_subquery())),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+
+        total += result.rowcount
+        if result.rowcount < batch_size:
+            return total
+
+
+def maintain_queue():
+    """Requeue jobs from dead workers and purge old finished jobs."""
+    requeue_stale_jobs()
+    purge_finished_jobs(current_app.config['JOBS_DONE_RETENTION'])
+
+
+def claim_job(worker_id):
+    """Claim the next due job for worker_id, or return None.
+
+    On PostgreSQL the candidate row is read with FOR UPDATE SKIP LOCKED so
+    concurrent workers never wait on each other; the conditional UPDATE
+    makes the claim safe on SQLite too, where the clause is ignored.
+    """
+
+    for _ in range(5):
+        now = datetime.utcnow()
+        job_id = db.session.execute(
+            select(Job.id)
+            .where(Job.status == 'queued', Job.run_at <= now)
+            .order_by(Job.run_at, Job.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        ).scalar()
+
+        if job_id is None:
+            db.session.commit()
+            return None
+
+        result = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == 'queued')
+            .values(status='running', locked_by=worker_id, locked_at=now,
+                    started_at=now, attempts=Job.attempts + 1),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+
+        if result.rowcount == 1:
+            return db.session.get(Job, job_id)
+
+    return None
+
+
+def run_job(claimed):
+    """Run a claimed job and record success, a retry or a final failure."""
+
+    handler = HANDLERS.get(claimed.name)
+
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job {claimed.name!r}")
+        handler(**json.loads(claimed.payload))
+        # Record completion in the same transaction as the handler's work
+        claimed.status = 'done'
+        claimed.finished_at = datetime.utcnow()
+        claimed.locked_by = None
+        claimed.locked_at = None
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        claimed = db.session.get(Job, claimed.id)
+        claimed.last_error = f"{type(e).__name__}: {e}"
+        claimed.locked_by = None
+        claimed.locked_at = None
+        if claimed.attempts >= claimed.max_attempts:
+            claimed.status = 'failed'
+            claimed.finished_at = datetime.utcnow()
+        else:
+            claimed.status = 'queued'
+            claimed.run_at = datetime.utcnow() + timedelta(
+                seconds=retry_delay(claimed.attempts))
+        db.session.commit()
+        return False
+
+    return True
+
+
+def work(worker_id, burst=False):
+    """Process jobs until stopped; with burst, stop when the queue is empty."""
+
+    poll_interval = current_app.config['JOBS_POLL_SECONDS']
+    maintenance_interval = current_app.config['JOBS_MAINTENANCE_SECONDS']
+    next_maintenance = 0
+
+    while True:
+        # Not just at startup: a job stuck 'running' also stops the
+        # self-rescheduling jobs it would have queued next
+        if time.monotonic() >= next_maintenance:
+            maintain_queue()
+            next_maintenance = time.monotonic() + maintenance_interval
+
+        claimed = claim_job(worker_id)
+        if claimed is None:
+            if burst:
+                return
+            time.sleep(poll_interval)
+            continue
+        run_job(claimed)
+
+
+def _worker_process(app, index, burst):
+    """Entry point for a forked worker process."""
+    with app.app_context():
+        # Connections inherited from the parent must not be shared
+        db.engine.dispose(close=False)
+        work(f"{socket.gethostname()}:{os.getpid()}:{index}", burst=burst)
+
+
+def queue_metrics(sample_size=500):
+    """Return queue depth and latency figures for monitoring."""
+
+    now = datetime.utcnow()
+
+    depth = dict(
+        db.session.query(Job.status, func.count(Job.id)).group_by(Job.status)
+    )
+    ready = Job.query.filter(Job.status == 'queued', Job.run_at <= now).count()
+    oldest_ready = db.session.query(func.min(Job.run_at)).filter(
+        Job.status == 'queued', Job.run_at <= now
+    ).scalar()
+
+    recent = db.session.query(Job.run_at, Job.started_at, Job.finished_at).filter(
+        Job.status == 'done'
+    ).order_by(Job.finished_at.desc()).limit(sample_size).all()
+
+    waits = [(started - run_at).total_seconds() for run_at, started, _ in recent]
+    runs = [(finished - started).total_seconds() for _, started, finished in recent]
+
+    return {
+        'depth': {status: depth.get(status, 0)
+                  for status in ('queued', 'running', 'done', 'failed')},
+        'ready': ready,
+        'oldest_ready_age_seconds': (now - oldest_ready).total_seconds() if oldest_ready else 0,
+        'avg_wait_seconds': sum(waits) / len(waits) if waits else 0,
+        'avg_run_seconds': sum(runs) / len(runs) if runs else 0,
+    }
+
+
+def init_jobs(app):
+    """Configure the job queue and register its CLI commands."""
+
+    app.config.setdefault('JOBS_MAX_ATTEMPTS', 5)
+    app.config.setdefault('JOBS_RETRY_BASE_SECONDS', 5)
+    app.config.setdefault('JOBS_RETRY_MAX_SECONDS', 3600)
+    app.config.setdefault('JOBS_LOCK_TIMEOUT_SECONDS', 900)
+    app.config.setdefault('JOBS_POLL_SECONDS', 1)
+    app.config.setdefault('JOBS_MAINTENANCE_SECONDS', 60)
+    app.config.setdefault('JOBS_DONE_RETENTION', timedelta(days=7))
+
+    @app.cli.command('worker')
+    @click.option('--processes', '-n', default=1, show_default=True,
+                  help='Number of worker processes to run.')
+    @click.option('--burst', is_flag=True,
+                  help='Exit once the queue is empty.')
+    def worker_command(processes, burst):
+        """Run background job workers."""
+
+        if processes == 1:
+            work(f"{socket.gethostname()}:{os.getpid()}", burst=burst)
+            return
+
+        ctx = multiprocessing.get_context('fork')
+
+        def start(index):
+            proc = ctx.Process(target=_worker_process, args=(app, index, burst))
+            proc.start()
+            return proc
+
+        workers = {i: start(i) for i in range(processes)}
+        while workers:
+            multiprocessing.connection.wait([proc.sentinel for proc in workers.values()])
+            for index, proc in list(workers.items()):
+                if proc.is_alive():
+                    continue
+                proc.join()
+                if burst or proc.exitcode == 0:
+                    del workers[index]
+                else:
+                    # Its job is requeued by the next maintenance pass
+                    click.echo(f"Worker {index} exited with {proc.exitcode}; restarting",
+                               err=True)
+                    time.sleep(1)
+                    workers[index] = start(index)
+
+    @app.cli.command('purge-jobs')
+    def purge_jobs_command():
+        """Delete finished jobs older than JOBS_DONE_RETENTION."""
+        deleted = purge_finished_jobs(app.config['JOBS_DONE_RETENTION'])
+        click.echo(f"Deleted {deleted} finished jobs")
+
+    @app.cli.command('queue-stats')
+    def queue_stats_command():
+        """Print job queue depth and latency."""
+        click.echo(json.dumps(queue_metrics(), indent=2))
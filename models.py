@@ -5,8 +5,12 @@ Database models for ArtSwap application.
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
 
-db = SQLAlchemy()
+from replicas import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 bcrypt = Bcrypt()
 
 class User(db.Model):
@@ -19,13 +23,17 @@ class User(db.Model):
     email = db.Column(db.String(100), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    is_admin = db.Column(db.Boolean, nullable=False, default=False)
     
     # Relationships
     # Keep using user_id but specify foreign_keys to avoid ambiguity
+    # Collections can be huge, so this is never loaded whole; query it
+    # with user.art_pieces.select()
     art_pieces = db.relationship('ArtPiece', 
                                 foreign_keys='ArtPiece.user_id',
                                 backref='owner', 
-                                lazy=True,
+                                lazy='write_only',
+                                passive_deletes=True,
                                 cascade="all, delete-orphan")
     
     # Add relationship for original creations
@@ -72,6 +80,18 @@ class User(db.Model):
         
         return False
     
+    def has_art(self):
+        """Check if the user owns any artwork."""
+        return db.session.query(
+            self.art_pieces.select().exists()
+        ).scalar()
+    
+    def owns_art(self, art_id):
+        """Check if the user owns the given art piece."""
+        return db.session.query(
+            self.art_pieces.select().where(ArtPiece.id == art_id).exists()
+        ).scalar()
+    
     def __repr__(self):
         return f"<User #{self.id}: {self.username}>"
 
@@ -93,7 +113,28 @@ class ArtPiece(db.Model):
     original_creator_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped on every change, including ownership moving in a trade
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     traded = db.Column(db.Boolean, default=False)
+
+    # Intrinsic image metadata, filled at upload (see images.py). Lets pages
+    # reserve space and paint a placeholder before the image arrives.
+    image_width = db.Column(db.Integer)
+    image_height = db.Column(db.Integer)
+    image_bytes = db.Column(db.Integer)
+    image_format = db.Column(db.String(10))
+    dominant_color = db.Column(db.String(7))
+    image_placeholder = db.Column(db.Text)
+
+    __table_args__ = (
+        db.Index('ix_art_pieces_user_id_title', 'user_id', 'title'),
+        # Listings filter on one of these and show the newest first
+        db.Index('ix_art_pieces_created_at', 'created_at'),
+        db.Index('ix_art_pieces_user_id_created_at', 'user_id', 'created_at'),
+        db.Index('ix_art_pieces_original_creator_id_created_at',
+                 'original_creator_id', 'created_at'),
+        db.Index('ix_art_pieces_traded_created_at', 'traded', 'created_at'),
+    )
     
     # Relationships for trades
     offered_in_trades = db.relationship('Trade',
@@ -112,9 +153,11 @@ class ArtPiece(db.Model):
     
     def previous_owner(self):
         """Get the previous owner of this artwork if it was traded."""
-        if self.original_creator_id and self.original_creator_id != self.user_id:
-            return User.query.get(self.original_creator_id)
-        return None
+        return User.query.join(
+            OwnershipEvent, OwnershipEvent.previous_owner_id == User.id
+        ).filter(
+            OwnershipEvent.art_id == self.id
+        ).order_by(OwnershipEvent.seq.desc()).first()
     
     def __repr__(self):
         return f"<ArtPiece #{self.id}: {self.title}>"
@@ -130,10 +173,23 @@ class Trade(db.Model):
     receiver_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     sender_art_id = db.Column(db.Integer, db.ForeignKey('art_pieces.id'), nullable=False)
     receiver_art_id = db.Column(db.Integer, db.ForeignKey('art_pieces.id'), nullable=False)
-    status = db.Column(db.String(20), default='pending')  # pending, accepted, rejected
+    status = db.Column(db.String(20), default='pending')  # pending, accepted, rejected, expired
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        # Lets the expiry sweeper find the oldest pending trades quickly
+        db.Index('ix_trades_status_created_at', 'status', 'created_at'),
+        # Let the stats rollup scan new offers and decisions since its marks
+        db.Index('ix_trades_created_at_id', 'created_at', 'id'),
+        db.Index('ix_trades_updated_at_id', 'updated_at', 'id'),
+        # A user can only have one pending offer of a piece for another piece
+        db.Index('uq_trades_pending_offer', 'sender_id', 'receiver_art_id', 'sender_art_id',
+                 unique=True,
+                 sqlite_where=db.text("status = 'pending'"),
+                 postgresql_where=db.text("status = 'pending'")),
+    )
+    
     def __repr__(self):
         return f"<Trade #{self.id}: {self.status}>"
     
@@ -151,6 +207,217 @@ class Trade(db.Model):
     def is_rejected(self):
         """Check if the trade is rejected."""
         return self.status == 'rejected'
+    
+    @property
+    def is_expired(self):
+        """Check if the trade expired while pending."""
+        return self.status == 'expired'
+
+
+class OwnershipEvent(db.Model):
+    """Append-only ledger entry recording who owned an art piece and when."""
+    
+    __tablename__ = 'ownership_events'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    art_id = db.Column(db.Integer, db.ForeignKey('art_pieces.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)  # 1 for the creator, then +1 per transfer
+    owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    previous_owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    trade_id = db.Column(db.Integer, db.ForeignKey('trades.id'), nullable=True)
+    kind = db.Column(db.String(20), nullable=False)  # created, traded
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    art = db.relationship('ArtPiece')
+    
+    __table_args__ = (
+        db.Index('ix_ownership_events_art_id_seq', 'art_id', 'seq', unique=True),
+    )
+    
+    def __repr__(self):
+        return f"<OwnershipEvent art #{self.art_id} seq {self.seq}: user #{self.owner_id}>"
+
+
+@event.listens_for(OwnershipEvent, 'before_update')
+@event.listens_for(OwnershipEvent, 'before_delete')
+def _ownership_events_are_append_only(mapper, connection, target):
+    raise ValueError("Ownership events are append-only")
+
+
+class TradeEvent(db.Model):
+    """Trade notification stored for the database event broker."""
+    
+    __tablename__ = 'trade_events'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    kind = db.Column(db.String(30), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_trade_events_user_id_id', 'user_id', 'id'),
+    )
+    
+    def __repr__(self):
+        return f"<TradeEvent #{self.id}: {self.kind}>"
+
+class Job(db.Model):
+    """Background job queued for the worker."""
+    
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    dedupe_key = db.Column(db.String(255), nullable=True)
+    status = db.Column(db.String(20), default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+        # Purging and latency metrics read finished jobs by finish time
+        db.Index('ix_jobs_status_finished_at', 'status', 'finished_at'),
+        # Only one unfinished job may hold a given dedupe key
+        db.Index('uq_jobs_active_dedupe_key', 'dedupe_key', unique=True,
+                 sqlite_where=db.text("status IN ('queued', 'running')"),
+                 postgresql_where=db.text("status IN ('queued', 'running')")),
+    )
+    
+    def __repr__(self):
+        return f"<Job #{self.id}: {self.name} {self.status}>"
+
+
+class DailyTradeStats(db.Model):
+    """Site-wide trade activity for one day, maintained by rollups.py."""
+    
+    __tablename__ = 'daily_trade_stats'
+    
+    day = db.Column(db.Date, primary_key=True)
+    offers = db.Column(db.Integer, nullable=False, default=0)
+    accepted = db.Column(db.Integer, nullable=False, default=0)
+    rejected = db.Column(db.Integer, nullable=False, default=0)
+    expired = db.Column(db.Integer, nullable=False, default=0)
+    # JSON list of decision counts per log2(seconds) bucket
+    decision_histogram = db.Column(db.Text, nullable=False, default='[]')
+    
+    def __repr__(self):
+        return f"<DailyTradeStats {self.day}: {self.offers} offers>"
+
+
+class UserDailyTradeStats(db.Model):
+    """One user's trade activity for one day, maintained by rollups.py."""
+    
+    __tablename__ = 'user_daily_trade_stats'
+    
+    day = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    offers_sent = db.Column(db.Integer, nullable=False, default=0)
+    offers_received = db.Column(db.Integer, nullable=False, default=0)
+    # Decisions on trades the user took part in, on either side
+    accepted = db.Column(db.Integer, nullable=False, default=0)
+    rejected = db.Column(db.Integer, nullable=False, default=0)
+    expired = db.Column(db.Integer, nullable=False, default=0)
+    # How long the user took to answer offers they received
+    decision_histogram = db.Column(db.Text, nullable=False, default='[]')
+    
+    __table_args__ = (
+        db.Index('ix_user_daily_trade_stats_user_id_day', 'user_id', 'day'),
+    )
+    
+    def __repr__(self):
+        return f"<UserDailyTradeStats {self.day} user #{self.user_id}>"
+
+
+class ArtTradeCount(db.Model):
+    """Number of accepted trades each art piece has been part of."""
+    
+    __tablename__ = 'art_trade_counts'
+    
+    art_id = db.Column(db.Integer, db.ForeignKey('art_pieces.id'), primary_key=True)
+    trades = db.Column(db.Integer, nullable=False, default=0)
+    last_traded_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        db.Index('ix_art_trade_counts_trades', 'trades'),
+    )
+    
+    def __repr__(self):
+        return f"<ArtTradeCount art #{self.art_id}: {self.trades}>"
+
+
+class RollupState(db.Model):
+    """High-water mark of a rollup: the last (timestamp, id) it processed."""
+    
+    __tablename__ = 'rollup_state'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    high_water_at = db.Column(db.DateTime, nullable=False, default=datetime.min)
+    high_water_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<RollupState {self.name}: {self.high_water_at} #{self.high_water_id}>"
+
+
+class IdempotencyKey(db.Model):
+    """Outcome of a POST sent with an Idempotency-Key header."""
+    
+    __tablename__ = 'idempotency_keys'
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    # NULL while the original request is still running
+    response_status = db.Column(db.Integer)
+    response_location = db.Column(db.String(2048))
+    response_body = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('uq_idempotency_keys_user_id_key', 'user_id', 'key', unique=True),
+        db.Index('ix_idempotency_keys_created_at', 'created_at'),
+    )
+    
+    @property
+    def in_progress(self):
+        """Check if the original request has not finished yet."""
+        return self.response_status is None
+    
+    def __repr__(self):
+        return f"<IdempotencyKey #{self.id}: user #{self.user_id} {self.key}>"
+
+
+def insert_or_ignore(model, values, conflict_columns, where=None):
+    """INSERT a row unless it collides with a unique index, in one statement.
+    
+    conflict_columns (and where, for a partial index) name the index.
+    Returns the new instance, or None if a conflicting row already exists.
+    """
+    
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        insert = postgresql.insert
+    elif dialect == 'sqlite':
+        insert = sqlite.insert
+    else:
+        raise NotImplementedError(f"insert_or_ignore() does not support {dialect}")
+    
+    stmt = insert(model).values(**values).on_conflict_do_nothing(
+        index_elements=conflict_columns,
+        index_where=where
+    ).returning(model)
+    return db.session.scalars(stmt).first()
+
 
 def connect_db(app):
     """Connect this database to provided Flask app."""
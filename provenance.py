@@ -0,0 +1,184 @@
+"""
+Ownership provenance for ArtSwap art pieces.
+
+Every change of hands is appended to the ownership_events ledger: seq 1
+when a piece is uploaded, then one row per accepted trade. The full chain
+for one piece, or for a page of pieces, is read back with a single
+recursive query walking (art_id, seq).
+"""
+
+from collections import namedtuple
+
+import click
+from sqlalchemy import func, or_, select
+
+from models import db, User, ArtPiece, Trade, OwnershipEvent
+
+ProvenanceEntry = namedtuple('ProvenanceEntry', [
+    'seq', 'owner_id', 'owner_username', 'previous_owner_id',
+    'trade_id', 'kind', 'acquired_at'
+])
+
+
+def record_creation(art):
+    """Start the ledger for a newly uploaded piece."""
+    db.session.add(OwnershipEvent(
+        art=art,
+        seq=1,
+        owner_id=art.user_id,
+        kind='created'
+    ))
+
+
+def record_transfer(art, new_owner_id, previous_owner_id, trade=None):
+    """Append a change of ownership for art to the ledger."""
+
+    last_seq = db.session.query(
+        func.coalesce(func.max(OwnershipEvent.seq), 0)
+    ).filter(OwnershipEvent.art_id == art.id).scalar()
+
+    if last_seq == 0:
+        # The piece predates the ledger and has not been backfilled yet;
+        # write its history first, or the backfill would later skip it
+        last_seq = _replay_history([art], exclude_trade=trade)[art.id]
+
+    db.session.add(OwnershipEvent(
+        art_id=art.id,
+        seq=last_seq + 1,
+        owner_id=new_owner_id,
+        previous_owner_id=previous_owner_id,
+        trade_id=trade.id if trade else None,
+        kind='traded'
+    ))
+
+
+def ownership_chains(art_ids):
+    """Return {art_id: [ProvenanceEntry, ...]} for many pieces in one query."""
+
+    if not art_ids:
+        return {}
+
+    events = OwnershipEvent.__table__
+    columns = ('art_id', 'seq', 'owner_id', 'previous_owner_id',
+               'trade_id', 'kind', 'created_at')
+
+    chain = select(*[events.c[name] for name in columns]).where(
+        events.c.art_id.in_(art_ids),
+        events.c.seq == 1
+    ).cte('chain', recursive=True)
+
+    step = events.alias('step')
+    chain = chain.union_all(
+        select(*[step.c[name] for name in columns]).join(
+            chain,
+            (step.c.art_id == chain.c.art_id) & (step.c.seq == chain.c.seq + 1)
+        )
+    )
+
+    stmt = select(chain, User.username).join(
+        User, User.id == chain.c.owner_id
+    ).order_by(chain.c.art_id, chain.c.seq)
+
+    chains = {art_id: [] for art_id in art_ids}
+    for row in db.session.execute(stmt):
+        chains[row.art_id].append(ProvenanceEntry(
+            seq=row.seq,
+            owner_id=row.owner_id,
+            owner_username=row.username,
+            previous_owner_id=row.previous_owner_id,
+            trade_id=row.trade_id,
+            kind=row.kind,
+            acquired_at=row.created_at
+        ))
+    return chains
+
+
+def ownership_chain(art_id):
+    """Return the list of ProvenanceEntry for one piece, oldest first."""
+    return ownership_chains([art_id])[art_id]
+
+
+def _replay_history(pieces, exclude_trade=None):
+    """Add ledger entries for pieces from their creator and accepted trades.
+
+    The original owner and each accepted trade are replayed in order of
+    acceptance. Returns {art_id: seq of the last entry written}.
+    """
+
+    ids = [art.id for art in pieces]
+    trades = db.session.scalars(
+        select(Trade)
+        .where(
+            Trade.status == 'accepted',
+            or_(Trade.sender_art_id.in_(ids), Trade.receiver_art_id.in_(ids))
+        )
+        .order_by(Trade.updated_at, Trade.id)
+    ).all()
+
+    history = {art_id: [] for art_id in ids}
+    for trade in trades:
+        if exclude_trade is not None and trade.id == exclude_trade.id:
+            continue
+        if trade.sender_art_id in history:
+            history[trade.sender_art_id].append((trade, trade.sender_id, trade.receiver_id))
+        if trade.receiver_art_id in history:
+            history[trade.receiver_art_id].append((trade, trade.receiver_id, trade.sender_id))
+
+    last_seqs = {}
+    for art in pieces:
+        transfers = history[art.id]
+        first_owner = transfers[0][1] if transfers else art.user_id
+        db.session.add(OwnershipEvent(
+            art_id=art.id, seq=1, owner_id=first_owner,
+            kind='created', created_at=art.created_at
+        ))
+        for seq, (trade, previous_owner_id, new_owner_id) in enumerate(transfers, start=2):
+            db.session.add(OwnershipEvent(
+                art_id=art.id, seq=seq, owner_id=new_owner_id,
+                previous_owner_id=previous_owner_id, trade_id=trade.id,
+                kind='traded', created_at=trade.updated_at
+            ))
+        last_seqs[art.id] = len(transfers) + 1
+    return last_seqs
+
+
+def backfill_ownership_events(batch_size=500):
+    """Build ledger entries for pieces that predate the ledger.
+
+    Pieces that already have entries are skipped, so the backfill can be
+    rerun safely. Returns the number of pieces filled.
+    """
+
+    filled = 0
+    last_id = 0
+
+    while True:
+        pieces = db.session.scalars(
+            select(ArtPiece)
+            .where(
+                ArtPiece.id > last_id,
+                ~select(OwnershipEvent.id)
+                .where(OwnershipEvent.art_id == ArtPiece.id)
+                .exists()
+            )
+            .order_by(ArtPiece.id)
+            .limit(batch_size)
+        ).all()
+        if not pieces:
+            return filled
+
+        _replay_history(pieces)
+        db.session.commit()
+        filled += len(pieces)
+        last_id = pieces[-1].id
+
+
+def init_provenance(app):
+    """Register the provenance CLI commands."""
+
+    @app.cli.command('backfill-provenance')
+    @click.option('--batch-size', default=500, show_default=True)
+    def backfill_provenance_command(batch_size):
+        """Populate ownership_events from existing pieces and trades."""
+        filled = backfill_ownership_events(batch_size)
+        click.echo(f"Backfilled provenance for {filled} art pieces")
@@ -0,0 +1,195 @@
+"""
+Read models for ArtSwap listing pages.
+
+Listing pages only print titles, thumbnails and usernames, so rather than
+hydrating full ORM objects (with description text, identity-map state and
+lazy relationships) they select just those columns and wrap each row in a
+small named tuple. The tuples mirror the attribute names of the models
+they stand in for, so templates read them the same way.
+"""
+
+from typing import NamedTuple, Optional
+from datetime import datetime
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import aliased
+
+from models import db, User, ArtPiece, Trade
+
+# Descriptions are only shown through |truncate(50), which never needs
+# more than the first 55 characters to decide how to cut
+DESCRIPTION_SNIPPET_LENGTH = 60
+
+
+class UserRef(NamedTuple):
+    id: int
+    username: str
+
+
+class ArtThumb(NamedTuple):
+    """What art_image() needs to draw a piece, plus its title."""
+    id: int
+    title: str
+    image_url: str
+    image_width: Optional[int]
+    image_height: Optional[int]
+    dominant_color: Optional[str]
+    image_placeholder: Optional[str]
+
+
+class ArtCard(NamedTuple):
+    """A piece in a listing grid."""
+    id: int
+    title: str
+    image_url: str
+    image_width: Optional[int]
+    image_height: Optional[int]
+    dominant_color: Optional[str]
+    image_placeholder: Optional[str]
+    description: Optional[str]
+    traded: bool
+    created_at: datetime
+    creator: Optional[UserRef]
+
+
+class TradeCard(NamedTuple):
+    """A trade in one of the dashboard panels."""
+    id: int
+    status: str
+    sender_id: int
+    receiver_id: int
+    sender: UserRef
+    receiver: UserRef
+    offered_art: ArtThumb
+    requested_art: ArtThumb
+    created_at: datetime
+    updated_at: datetime
+
+    @property
+    def is_pending(self):
+        return self.status == 'pending'
+
+    @property
+    def is_accepted(self):
+        return self.status == 'accepted'
+
+    @property
+    def is_rejected(self):
+        return self.status == 'rejected'
+
+    @property
+    def is_expired(self):
+        return self.status == 'expired'
+
+
+def _thumb_columns(art):
+    return (art.id, art.title, art.image_url, art.image_width, art.image_height,
+            art.dominant_color, art.image_placeholder)
+
+
+THUMB_WIDTH = len(ArtThumb._fields)
+
+# Module-level aliases keep the generated statements identical between
+# calls, so SQLAlchemy's compiled-statement cache is hit every time
+_creator = aliased(User, name='creator')
+_sender = aliased(User, name='sender')
+_receiver = aliased(User, name='receiver')
+_offered = aliased(ArtPiece, name='offered_art')
+_requested = aliased(ArtPiece, name='requested_art')
+
+
+def art_cards_select():
+    """Select ArtCard columns; add filters, ordering and limits to taste."""
+
+    return (
+        select(*_thumb_columns(ArtPiece),
+               func.substr(ArtPiece.description, 1, DESCRIPTION_SNIPPET_LENGTH),
+               ArtPiece.traded, ArtPiece.created_at,
+               _creator.id, _creator.username)
+        .outerjoin(_creator, _creator.id == ArtPiece.original_creator_id)
+    )
+
+
+def load_art_cards(stmt):
+    """Execute an art_cards_select() statement into ArtCards."""
+
+    cards = []
+    for row in db.session.execute(stmt):
+        creator_id, creator_username = row[-2:]
+        cards.append(ArtCard(
+            *row[:-2],
+            creator=UserRef(creator_id, creator_username) if creator_id else None
+        ))
+    return cards
+
+
+def recent_art_cards(limit=8, offset=0, criteria=()):
+    """Newest pieces across the site, optionally filtered by criteria."""
+    return load_art_cards(
+        art_cards_select()
+        .where(*criteria)
+        .order_by(ArtPiece.created_at.desc(), ArtPiece.id.desc())
+        .limit(limit).offset(offset)
+    )
+
+
+def user_art_cards(user_id):
+    """Every piece the user owns, newest first."""
+    return load_art_cards(
+        art_cards_select()
+        .where(ArtPiece.user_id == user_id)
+        .order_by(ArtPiece.created_at.desc())
+    )
+
+
+def trade_cards(*criteria, order_by=None, limit=None):
+    """TradeCards for trades matching criteria, with both users and pieces."""
+
+    stmt = (
+        select(Trade.id, Trade.status, Trade.sender_id, Trade.receiver_id,
+               Trade.created_at, Trade.updated_at,
+               _sender.username, _receiver.username,
+               *_thumb_columns(_offered), *_thumb_columns(_requested))
+        .join(_sender, _sender.id == Trade.sender_id)
+        .join(_receiver, _receiver.id == Trade.receiver_id)
+        .join(_offered, _offered.id == Trade.sender_art_id)
+        .join(_requested, _requested.id == Trade.receiver_art_id)
+        .where(*criteria)
+        .order_by(order_by)
+        .limit(limit)
+    )
+
+    cards = []
+    for row in db.session.execute(stmt):
+        (trade_id, status, sender_id, receiver_id, created_at, updated_at,
+         sender_username, receiver_username) = row[:8]
+        cards.append(TradeCard(
+            trade_id, status, sender_id, receiver_id,
+            UserRef(sender_id, sender_username),
+            UserRef(receiver_id, receiver_username),
+            ArtThumb(*row[8:8 + THUMB_WIDTH]),
+            ArtThumb(*row[8 + THUMB_WIDTH:]),
+            created_at, updated_at
+        ))
+    return cards
+
+
+def dashboard_panels(user_id, history_limit=10):
+    """Everything the dashboard lists for a user, as read models."""
+
+    return {
+        'user_art': user_art_cards(user_id),
+        'incoming_trades': trade_cards(
+            Trade.receiver_id == user_id, Trade.status == 'pending',
+            order_by=Trade.created_at.desc()
+        ),
+        'outgoing_trades': trade_cards(
+            Trade.sender_id == user_id, Trade.status == 'pending',
+            order_by=Trade.created_at.desc()
+        ),
+        'trade_history': trade_cards(
+            or_(Trade.sender_id == user_id, Trade.receiver_id == user_id),
+            Trade.status != 'pending',
+            order_by=Trade.updated_at.desc(), limit=history_limit
+        ),
+    }
@@ -0,0 +1,130 @@
+"""
+Read-replica routing for ArtSwap.
+
+Replica URIs listed in SQLALCHEMY_REPLICA_URIS become binds named
+replica_0, replica_1, ... RoutingSession sends reads from GET/HEAD requests
+and read_only() blocks to a random replica; flushes, INSERT/UPDATE/DELETE
+statements and everything else go to the primary. A browser that has just committed a write is pinned to the
+primary for REPLICA_STICKY_SECONDS so it always reads its own writes.
+"""
+
+import random
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+REPLICA_BIND_PREFIX = 'replica_'
+STICKY_KEY = 'primary_until'
+READ_METHODS = ('GET', 'HEAD')
+
+
+class RoutingSession(Session):
+    """Session that routes reads to replicas and writes to the primary."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        """Pick a replica engine for reads, otherwise defer to the primary."""
+
+        is_write = clause is not None and getattr(clause, 'is_dml', False)
+        if bind is None and not is_write and self._reads_from_replica():
+            replicas = [engine for key, engine in self._db.engines.items()
+                        if key and key.startswith(REPLICA_BIND_PREFIX)]
+            if replicas:
+                return random.choice(replicas)
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_from_replica(self):
+        """Decide whether the next statement may be served by a replica."""
+
+        # Once this transaction has written, only the primary can see it
+        if (self._flushing or self.info.get('wrote') or
+                self.info.get('force_primary')):
+            return False
+
+        if self.info.get('read_only'):
+            return True
+
+        if not has_request_context() or request.method not in READ_METHODS:
+            return False
+
+        # A request that committed a write keeps reading it back
+        if g.get('committed_write'):
+            return False
+
+        return flask_session.get(STICKY_KEY, 0) < time.time()
+
+
+@contextmanager
+def _session_flag(session, flag):
+    previous = session.info.get(flag)
+    session.info[flag] = True
+    try:
+        yield
+    finally:
+        session.info[flag] = previous
+
+
+def read_only(session):
+    """Send reads in this block to a replica, even outside GET requests."""
+    return _session_flag(session, 'read_only')
+
+
+def use_primary(session):
+    """Send every query in this block to the primary."""
+    return _session_flag(session, 'force_primary')
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_write(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _mark_statement_write(orm_execute_state):
+    """Count INSERT/UPDATE/DELETE run through session.execute() as writes.
+
+    These never flush, so after_flush alone would miss them.
+    """
+    if (orm_execute_state.is_insert or orm_execute_state.is_update or
+            orm_execute_state.is_delete):
+        orm_execute_state.session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _note_commit(session):
+    """Remember that this request committed a write."""
+    if session.info.pop('wrote', False) and has_request_context():
+        g.committed_write = True
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _clear_write(session):
+    session.info.pop('wrote', None)
+
+
+def _pin_to_primary(response):
+    """Pin the browser to the primary for a while after it writes."""
+    if g.get('committed_write'):
+        flask_session[STICKY_KEY] = (
+            time.time() + current_app.config['REPLICA_STICKY_SECONDS'])
+    return response
+
+
+def init_replicas(app):
+    """Register replica binds and sticky-to-primary tracking.
+
+    Must run before connect_db() so the replica engines are created along
+    with the primary.
+    """
+
+    app.config.setdefault('SQLALCHEMY_REPLICA_URIS', [])
+    app.config.setdefault('REPLICA_STICKY_SECONDS', 5)
+
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    for i, uri in enumerate(app.config['SQLALCHEMY_REPLICA_URIS']):
+        binds[f'{REPLICA_BIND_PREFIX}{i}'] = uri
+
+    app.after_request(_pin_to_primary)
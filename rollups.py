@@ -0,0 +1,353 @@
+"""
+Incremental trade statistics for ArtSwap.
+
+Trade activity is rolled up into daily site-wide and per-user rows plus a
+per-piece count of accepted trades, so the admin stats pages never run
+GROUP BY over the trades table. Two streams feed the rollups, each with
+its own high-water mark in rollup_state:
+
+* offers: every trade, in (created_at, id) order, counted once when made;
+* decisions: accepted, rejected and expired trades, in (updated_at, id)
+  order. These are final states, so each trade is decided exactly once.
+
+A stream only reads rows older than STATS_ROLLUP_LAG seconds, which leaves
+time for transactions stamped just before the mark to commit. Each batch
+updates the rollups and moves the mark in one transaction, so a run can
+stop at any point and the next one carries on without double counting.
+"""
+
+import json
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import and_, func, or_, select
+
+from models import (db, User, ArtPiece, Trade, DailyTradeStats, UserDailyTradeStats,
+                    ArtTradeCount, RollupState)
+from jobs import job, schedule_recurring
+
+DECIDED_STATUSES = ('accepted', 'rejected', 'expired')
+
+# Decision times are bucketed by powers of two seconds: bucket i holds
+# times in [2**i, 2**(i+1)), bucket 0 also takes anything under a second
+HISTOGRAM_BUCKETS = 32
+
+COUNT_FIELDS = {
+    DailyTradeStats: ('offers', 'accepted', 'rejected', 'expired'),
+    UserDailyTradeStats: ('offers_sent', 'offers_received', 'accepted', 'rejected', 'expired'),
+}
+
+
+def decision_bucket(seconds):
+    """Histogram bucket for a decision that took this many seconds."""
+    return min(max(int(seconds), 1).bit_length() - 1, HISTOGRAM_BUCKETS - 1)
+
+
+def merge_histograms(histograms):
+    """Add up histograms stored as JSON lists."""
+
+    merged = [0] * HISTOGRAM_BUCKETS
+    for histogram in histograms:
+        for bucket, count in enumerate(json.loads(histogram)):
+            merged[bucket] += count
+    return merged
+
+
+def approximate_median(histogram):
+    """Median of a decision-time histogram in seconds, or None if empty.
+
+    Interpolates linearly within the bucket holding the middle decision,
+    so the answer is within a factor of two of the true median.
+    """
+
+    total = sum(histogram)
+    if not total:
+        return None
+
+    middle = total / 2
+    seen = 0
+    for bucket, count in enumerate(histogram):
+        if count and seen + count >= middle:
+            lower = 2 ** bucket if bucket else 0
+            upper = 2 ** (bucket + 1)
+            return lower + (upper - lower) * (middle - seen) / count
+        seen += count
+
+
+def _add_to_rows(model, deltas):
+    """Add per-key deltas to rollup rows, creating rows as needed.
+
+    deltas maps primary-key tuples to Counters whose string keys are
+    count columns and whose int keys are decision histogram buckets.
+    """
+
+    if not deltas:
+        return
+
+    key_columns = model.__mapper__.primary_key
+    rows = {
+        tuple(getattr(row, column.key) for column in key_columns): row
+        for row in model.query.filter(*[
+            column.in_({key[i] for key in deltas})
+            for i, column in enumerate(key_columns)
+        ])
+    }
+
+    fields = COUNT_FIELDS[model]
+    for key, delta in deltas.items():
+        row = rows.get(key)
+        if row is None:
+            row = model(**{column.key: value for column, value in zip(key_columns, key)},
+                        **{field: 0 for field in fields}, decision_histogram='[]')
+            db.session.add(row)
+
+        histogram = json.loads(row.decision_histogram) or [0] * HISTOGRAM_BUCKETS
+        for name, amount in delta.items():
+            if isinstance(name, int):
+                histogram[name] += amount
+            else:
+                setattr(row, name, getattr(row, name) + amount)
+        row.decision_histogram = json.dumps(histogram)
+
+
+def _apply_offers(trades):
+    daily, per_user = defaultdict(Counter), defaultdict(Counter)
+    for trade in trades:
+        day = trade.created_at.date()
+        daily[(day,)]['offers'] += 1
+        per_user[(day, trade.sender_id)]['offers_sent'] += 1
+        per_user[(day, trade.receiver_id)]['offers_received'] += 1
+
+    _add_to_rows(DailyTradeStats, daily)
+    _add_to_rows(UserDailyTradeStats, per_user)
+
+
+def _apply_decisions(trades):
+    daily, per_user = defaultdict(Counter), defaultdict(Counter)
+    art_trades = Counter()
+    last_traded = {}
+
+    for trade in trades:
+        day = trade.updated_at.date()
+        daily[(day,)][trade.status] += 1
+        per_user[(day, trade.sender_id)][trade.status] += 1
+        per_user[(day, trade.receiver_id)][trade.status] += 1
+
+        if trade.status == 'expired':
+            continue
+        # Accepted and rejected trades were answered by their receiver
+        bucket = decision_bucket((trade.updated_at - trade.created_at).total_seconds())
+        daily[(day,)][bucket] += 1
+        per_user[(day, trade.receiver_id)][bucket] += 1
+
+        if trade.status == 'accepted':
+            for art_id in (trade.sender_art_id, trade.receiver_art_id):
+                art_trades[art_id] += 1
+                last_traded[art_id] = max(last_traded.get(art_id, trade.updated_at),
+                                          trade.updated_at)
+
+    _add_to_rows(DailyTradeStats, daily)
+    _add_to_rows(UserDailyTradeStats, per_user)
+
+    counts = {row.art_id: row for row in
+              ArtTradeCount.query.filter(ArtTradeCount.art_id.in_(art_trades))}
+    for art_id, trades_added in art_trades.items():
+        row = counts.get(art_id)
+        if row is None:
+            row = ArtTradeCount(art_id=art_id, trades=0)
+            db.session.add(row)
+        row.trades += trades_added
+        if row.last_traded_at is None or row.last_traded_at < last_traded[art_id]:
+            row.last_traded_at = last_traded[art_id]
+
+
+STREAMS = {
+    'offers': (Trade.created_at, (), _apply_offers),
+    'decisions': (Trade.updated_at, (Trade.status.in_(DECIDED_STATUSES),), _apply_decisions),
+}
+
+
+def _process_stream(name, upto, batch_size):
+    """Roll up one stream's trades up to upto; returns how many were read."""
+
+    column, criteria, apply = STREAMS[name]
+    processed = 0
+
+    while True:
+        # Locking the mark keeps concurrent runs from counting a batch twice
+        state = db.session.get(RollupState, name, with_for_update=True)
+        if state is None:
+            state = RollupState(name=name, high_water_at=datetime.min, high_water_id=0)
+            db.session.add(state)
+
+        trades = db.session.execute(
+            select(Trade.id, Trade.sender_id, Trade.receiver_id, Trade.sender_art_id,
+                   Trade.receiver_art_id, Trade.status, Trade.created_at, Trade.updated_at)
+            .where(*criteria, column <= upto, or_(
+                column > state.high_water_at,
+                and_(column == state.high_water_at, Trade.id > state.high_water_id)
+            ))
+            .order_by(column, Trade.id)
+            .limit(batch_size)
+        ).all()
+
+        if trades:
+            apply(trades)
+            state.high_water_at = getattr(trades[-1], column.key)
+            state.high_water_id = trades[-1].id
+        db.session.commit()
+
+        processed += len(trades)
+        if len(trades) < batch_size:
+            return processed
+
+
+def rollup_trade_stats(lag=60, batch_size=1000):
+    """Bring every rollup up to date with trades older than lag seconds.
+
+    Returns the number of trade rows read.
+    """
+
+    upto = datetime.utcnow() - timedelta(seconds=lag)
+    return sum(_process_stream(name, upto, batch_size) for name in STREAMS)
+
+
+def schedule_rollup(delay=0):
+    """Queue the next rollup run."""
+    return schedule_recurring('stats.rollup', current_app.config['STATS_ROLLUP_INTERVAL'],
+                              delay)
+
+
+@job('stats.rollup')
+def rollup_stats_job():
+    """Update the rollups, then schedule the next run."""
+
+    rollup_trade_stats(current_app.config['STATS_ROLLUP_LAG'],
+                       current_app.config['STATS_ROLLUP_BATCH_SIZE'])
+    schedule_rollup(delay=current_app.config['STATS_ROLLUP_INTERVAL'])
+
+
+##############################################################################
+# Reading the rollups
+
+def _summary(rows):
+    """Totals, acceptance rate and median decision time over rollup rows."""
+
+    summary = {field: sum(getattr(row, field) for row in rows)
+               for field in ('accepted', 'rejected', 'expired')}
+    decided = sum(summary.values())
+    summary['acceptance_rate'] = summary['accepted'] / decided if decided else None
+    summary['median_decision_seconds'] = approximate_median(
+        merge_histograms(row.decision_histogram for row in rows))
+    return summary
+
+
+def _as_of():
+    state = db.session.get(RollupState, 'decisions')
+    return state.high_water_at.isoformat() if state else None
+
+
+def site_stats(days=30, limit=10):
+    """Site-wide trade statistics for the last days, from the rollups."""
+
+    since = date.today() - timedelta(days=days - 1)
+    rows = DailyTradeStats.query.filter(
+        DailyTradeStats.day >= since
+    ).order_by(DailyTradeStats.day).all()
+
+    most_traded = db.session.execute(
+        select(ArtTradeCount.art_id, ArtPiece.title, ArtTradeCount.trades)
+        .join(ArtPiece, ArtPiece.id == ArtTradeCount.art_id)
+        .order_by(ArtTradeCount.trades.desc(), ArtTradeCount.art_id)
+        .limit(limit)
+    ).all()
+
+    top_traders = db.session.execute(
+        select(User.username,
+               func.sum(UserDailyTradeStats.offers_sent).label('offers_sent'),
+               func.sum(UserDailyTradeStats.offers_received).label('offers_received'),
+               func.sum(UserDailyTradeStats.accepted).label('accepted'))
+        .join(User, User.id == UserDailyTradeStats.user_id)
+        .where(UserDailyTradeStats.day >= since)
+        .group_by(User.username)
+        .order_by(func.sum(UserDailyTradeStats.offers_sent +
+                           UserDailyTradeStats.offers_received).desc())
+        .limit(limit)
+    ).all()
+
+    return {
+        'since': since.isoformat(),
+        'as_of': _as_of(),
+        'offers': sum(row.offers for row in rows),
+        **_summary(rows),
+        'daily': [
+            {'day': row.day.isoformat(), 'offers': row.offers, 'accepted': row.accepted,
+             'rejected': row.rejected, 'expired': row.expired}
+            for row in rows
+        ],
+        'most_traded': [row._asdict() for row in most_traded],
+        'top_traders': [row._asdict() for row in top_traders],
+    }
+
+
+def user_stats(user_id, days=30):
+    """One user's trade statistics for the last days, from the rollups."""
+
+    since = date.today() - timedelta(days=days - 1)
+    rows = UserDailyTradeStats.query.filter(
+        UserDailyTradeStats.user_id == user_id,
+        UserDailyTradeStats.day >= since
+    ).order_by(UserDailyTradeStats.day).all()
+
+    return {
+        'since': since.isoformat(),
+        'as_of': _as_of(),
+        'offers_sent': sum(row.offers_sent for row in rows),
+        'offers_received': sum(row.offers_received for row in rows),
+        **_summary(rows),
+        'daily': [
+            {'day': row.day.isoformat(), 'offers_sent': row.offers_sent,
+             'offers_received': row.offers_received, 'accepted': row.accepted,
+             'rejected': row.rejected, 'expired': row.expired}
+            for row in rows
+        ],
+    }
+
+
+def init_rollups(app):
+    """Configure trade stats rollups and register their CLI commands."""
+
+    app.config.setdefault('STATS_ROLLUP_LAG', 60)
+    app.config.setdefault('STATS_ROLLUP_INTERVAL', 300)
+    app.config.setdefault('STATS_ROLLUP_BATCH_SIZE', 1000)
+
+    @app.cli.command('rollup-stats')
+    @click.option('--schedule', is_flag=True,
+                  help='Queue a recurring rollup for the job worker instead.')
+    def rollup_stats_command(schedule):
+        """Update the trade statistics rollups."""
+
+        if schedule:
+            schedule_rollup()
+            db.session.commit()
+            click.echo("Scheduled recurring stats rollup")
+            return
+
+        processed = rollup_trade_stats(app.config['STATS_ROLLUP_LAG'],
+                                       app.config['STATS_ROLLUP_BATCH_SIZE'])
+        click.echo(f"Rolled up {processed} trade rows")
+
+    @app.cli.command('grant-admin')
+    @click.argument('username')
+    @click.option('--revoke', is_flag=True, help='Remove admin rights instead.')
+    def grant_admin_command(username, revoke):
+        """Let a user see the admin stats pages."""
+
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.ClickException(f"No such user: {username}")
+        user.is_admin = not revoke
+        db.session.commit()
+        click.echo(f"{username} is {'no longer' if revoke else 'now'} an admin")
@@ -0,0 +1,140 @@
+"""
+In-place schema upgrades for existing ArtSwap databases.
+
+db.create_all() only creates missing tables; it never adds columns or
+indexes to tables that already exist. `flask upgrade-db` brings an
+existing database up to the current models without losing data:
+
+- missing tables are created
+- missing columns are added with ALTER TABLE ... ADD COLUMN
+- missing indexes are created, after expiring duplicate pending offers
+  that would violate uq_trades_pending_offer
+
+It is idempotent, so it is safe to run on every deploy. Upgrade first,
+then run the data backfills:
+
+    flask upgrade-db
+    flask backfill-provenance
+    flask backfill-image-metadata
+"""
+
+import click
+from sqlalchemy import func, inspect, literal, select, update
+from sqlalchemy.schema import CreateColumn
+
+from models import db, ArtPiece, Trade
+
+
+def _column_ddl(column, dialect):
+    """ADD COLUMN clause for column, with a DEFAULT so NOT NULL columns fit."""
+
+    ddl = str(CreateColumn(column).compile(dialect=dialect))
+    default = column.default
+    if (column.server_default is None and default is not None and
+            default.is_scalar and not column.nullable):
+        value = literal(default.arg, column.type).compile(
+            dialect=dialect, compile_kwargs={'literal_binds': True})
+        ddl += f" DEFAULT {value}"
+    return ddl
+
+
+def _add_missing_columns(conn):
+    """Add model columns missing from existing tables; returns their names."""
+
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in present:
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {table.name} ADD COLUMN "
+                    f"{_column_ddl(column, conn.dialect)}"
+                )
+                added.append(f"{table.name}.{column.name}")
+
+    return added
+
+
+def _expire_duplicate_pending_offers(conn):
+    """Keep only the oldest pending copy of each offer; returns how many expired."""
+
+    keep = (
+        select(func.min(Trade.id))
+        .where(Trade.status == 'pending')
+        .group_by(Trade.sender_id, Trade.receiver_art_id, Trade.sender_art_id)
+    )
+    result = conn.execute(
+        update(Trade)
+        .where(Trade.status == 'pending', Trade.id.not_in(keep.scalar_subquery()))
+        .values(status='expired')
+    )
+    return result.rowcount
+
+
+def _create_missing_indexes(conn):
+    """Create model indexes missing from the database; returns their names."""
+
+    inspector = inspect(conn)
+    created = []
+
+    for table in db.metadata.sorted_tables:
+        present = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in present:
+                index.create(conn)
+                created.append(index.name)
+
+    return created
+
+
+def upgrade_schema():
+    """Bring the database up to the current models.
+
+    Returns a dict listing the columns added, indexes created and
+    duplicate pending offers expired.
+    """
+
+    db.create_all()
+
+    with db.engine.begin() as conn:
+        columns = _add_missing_columns(conn)
+        if 'art_pieces.updated_at' in columns:
+            # Conditional GETs compare updated_at; start it at upload time
+            conn.execute(update(ArtPiece)
+                         .where(ArtPiece.updated_at.is_(None))
+                         .values(updated_at=ArtPiece.created_at))
+
+        expired = 0
+        if 'uq_trades_pending_offer' not in {
+                index['name'] for index in inspect(conn).get_indexes('trades')}:
+            expired = _expire_duplicate_pending_offers(conn)
+
+        indexes = _create_missing_indexes(conn)
+
+    return {'columns': columns, 'indexes': indexes, 'expired_offers': expired}
+
+
+def init_schema(app):
+    """Register the schema upgrade CLI command."""
+
+    @app.cli.command('upgrade-db')
+    def upgrade_db_command():
+        """Add missing tables, columns and indexes to an existing database.
+
+        Run before the backfill commands (backfill-provenance,
+        backfill-image-metadata).
+        """
+        changes = upgrade_schema()
+        for name in changes['columns']:
+            click.echo(f"Added column {name}")
+        for name in changes['indexes']:
+            click.echo(f"Created index {name}")
+        if changes['expired_offers']:
+            click.echo(f"Expired {changes['expired_offers']} duplicate pending offers")
+        if not any(changes.values()):
+            click.echo("Database is up to date")
@@ -4,6 +4,7 @@ Seed file to make sample data for ArtSwap db.
 
 from app import db
 from models import User, ArtPiece, Trade
+from provenance import record_creation, record_transfer
 
 # Drop all tables
 db.drop_all()
@@ -95,7 +96,10 @@ art8 = ArtPiece(
     user_id=diana.id
 )
 
-db.session.add_all([art1, art2, art3, art4, art5, art6, art7, art8])
+for art in [art1, art2, art3, art4, art5, art6, art7, art8]:
+    art.original_creator_id = art.user_id
+    db.session.add(art)
+    record_creation(art)
 db.session.commit()
 
 # Add trades
@@ -134,4 +138,11 @@ trade4 = Trade(
 db.session.add_all([trade1, trade2, trade3, trade4])
 db.session.commit()
 
+# Carry out the accepted trade so ownership and provenance agree with it
+record_transfer(art4, diana.id, bob.id, trade3)
+record_transfer(art7, bob.id, diana.id, trade3)
+art4.user_id, art7.user_id = diana.id, bob.id
+art4.traded = art7.traded = True
+db.session.commit()
+
 print("Database seeded!")
\ No newline at end of file
@@ -0,0 +1,129 @@
+"""
+Template compilation caching and render profiling for ArtSwap.
+
+Compiled templates are kept in a Jinja bytecode cache on disk, shared by
+every worker process, and can be built ahead of time with
+`flask precompile-templates`. With TEMPLATE_PROFILING enabled, the time
+spent in each template (including extended and included ones) is reported
+in the Server-Timing header of every response.
+"""
+
+import os
+import time
+
+import click
+from flask import g
+from jinja2 import FileSystemBytecodeCache, Template
+
+
+def _profiled(render_func, name):
+    """Wrap a Jinja render function so its own time is charged to name.
+
+    Render functions are generators that call into the parent, included
+    and block render functions; time spent in those is subtracted, so each
+    template is charged only for its own output.
+    """
+
+    def render(context):
+        timings = g.get('template_timings')
+        if timings is None:
+            yield from render_func(context)
+            return
+
+        stack = g.template_stack
+        entry = timings.setdefault(name, {'calls': 0, 'seconds': 0.0})
+        entry['calls'] += 1
+
+        chunks = render_func(context)
+        while True:
+            nested = [0.0]
+            stack.append(nested)
+            start = time.perf_counter()
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                chunk = StopIteration
+            finally:
+                elapsed = time.perf_counter() - start
+                stack.pop()
+                if stack:
+                    stack[-1][0] += elapsed
+                entry['seconds'] += elapsed - nested[0]
+            if chunk is StopIteration:
+                return
+            yield chunk
+
+    return render
+
+
+class ProfiledTemplate(Template):
+    """Template whose root and block render functions are timed."""
+
+    @classmethod
+    def _from_namespace(cls, environment, namespace, globals):
+        template = super()._from_namespace(environment, namespace, globals)
+        template.root_render_func = _profiled(template.root_render_func, template.name)
+        template.blocks = {
+            block: _profiled(func, template.name)
+            for block, func in template.blocks.items()
+        }
+        return template
+
+
+def _start_profiling():
+    g.request_started = time.perf_counter()
+    g.template_timings = {}
+    g.template_stack = []
+
+
+def _add_server_timing(response):
+    """Report per-template render time in the Server-Timing header."""
+
+    timings = g.get('template_timings')
+    if timings is None:
+        return response
+
+    metrics = [
+        f'tpl-{i};desc="{name}";dur={entry["seconds"] * 1000:.2f}'
+        for i, (name, entry) in enumerate(timings.items())
+    ]
+    rendering = sum(entry['seconds'] for entry in timings.values())
+    metrics.append(f'render;dur={rendering * 1000:.2f}')
+    metrics.append(f'app;dur={(time.perf_counter() - g.request_started) * 1000:.2f}')
+
+    response.headers.add('Server-Timing', ', '.join(metrics))
+    return response
+
+
+def precompile_templates(app):
+    """Compile every template into the bytecode cache; return the count."""
+
+    env = app.jinja_env
+    names = env.list_templates(extensions=['html'])
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+def init_templating(app):
+    """Configure the bytecode cache, profiling hooks and CLI command."""
+
+    app.config.setdefault('TEMPLATE_CACHE_DIR',
+                          os.path.join(app.instance_path, 'jinja_cache'))
+    app.config.setdefault('TEMPLATE_PROFILING', False)
+
+    cache_dir = app.config['TEMPLATE_CACHE_DIR']
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+    if app.config['TEMPLATE_PROFILING']:
+        app.jinja_env.template_class = ProfiledTemplate
+        app.before_request(_start_profiling)
+        app.after_request(_add_server_timing)
+
+    @app.cli.command('precompile-templates')
+    def precompile_templates_command():
+        """Fill the template bytecode cache, e.g. during a deploy."""
+        count = precompile_templates(app)
+        click.echo(f"Compiled {count} templates into {cache_dir or 'memory only'}")
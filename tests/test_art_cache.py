@@ -0,0 +1,96 @@
+"""
+Tests for conditional GET and page caching of art detail pages.
+"""
+
+from unittest import TestCase
+from models import db, User, ArtPiece, Trade
+
+from app import app, art_page_cache, CURR_USER_KEY
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['TESTING'] = True
+
+
+class ArtPageCacheTestCase(TestCase):
+    """Test ETag/Last-Modified handling and the anonymous page cache."""
+
+    def setUp(self):
+        """Create two users with one piece each and a pending trade."""
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        db.drop_all()
+        db.create_all()
+        art_page_cache.clear()
+
+        self.user1 = User.signup("cacheuser1", "c1@test.com", "password")
+        self.user2 = User.signup("cacheuser2", "c2@test.com", "password")
+        db.session.commit()
+
+        self.art1 = ArtPiece(title="Cached Art 1", image_url="static/c1.jpg",
+                             user_id=self.user1.id, original_creator_id=self.user1.id)
+        self.art2 = ArtPiece(title="Cached Art 2", image_url="static/c2.jpg",
+                             user_id=self.user2.id, original_creator_id=self.user2.id)
+        db.session.add_all([self.art1, self.art2])
+        db.session.commit()
+
+        self.trade = Trade(sender_id=self.user1.id, receiver_id=self.user2.id,
+                           sender_art_id=self.art1.id, receiver_art_id=self.art2.id,
+                           status="pending")
+        db.session.add(self.trade)
+        db.session.commit()
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        """Clean up any failed transactions."""
+        db.session.rollback()
+        art_page_cache.clear()
+        self.ctx.pop()
+
+    def test_not_modified(self):
+        """A client with a current copy gets 304 by ETag or date."""
+
+        resp = self.client.get(f'/art/{self.art1.id}')
+        self.assertEqual(resp.status_code, 200)
+        etag = resp.headers['ETag']
+        last_modified = resp.headers['Last-Modified']
+
+        resp = self.client.get(f'/art/{self.art1.id}', headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 304)
+
+        resp = self.client.get(f'/art/{self.art1.id}', headers={
+            'If-Modified-Since': last_modified})
+        self.assertEqual(resp.status_code, 304)
+
+    def test_anonymous_page_cache(self):
+        """Logged-out visitors are served from the cache until it is invalidated."""
+
+        self.client.get(f'/art/{self.art1.id}')
+        self.assertIsNotNone(art_page_cache.get(self.art1.id))
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user2.id
+            c.post(f'/trade/{self.trade.id}/accept')
+
+        self.assertIsNone(art_page_cache.get(self.art1.id))
+
+    def test_ownership_change_updates_etag(self):
+        """Accepting a trade touches the piece and changes its ETag."""
+
+        before = self.client.get(f'/art/{self.art1.id}').headers['ETag']
+        updated_at = self.art1.updated_at
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user2.id
+            c.post(f'/trade/{self.trade.id}/accept')
+
+        # Use a fresh, logged-out browser
+        self.client = app.test_client()
+        self.assertGreater(db.session.get(ArtPiece, self.art1.id).updated_at, updated_at)
+        resp = self.client.get(f'/art/{self.art1.id}', headers={'If-None-Match': before})
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp.headers['ETag'], before)
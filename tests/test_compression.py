@@ -0,0 +1,84 @@
+"""
+Tests for response compression and HTML minification in ArtSwap.
+"""
+
+import gzip
+from unittest import TestCase
+
+from flask import Flask, Response
+
+from compression import init_compression, minify_html
+
+
+class CompressionTestCase(TestCase):
+    """Test encoding negotiation and minification."""
+
+    def setUp(self):
+        """Create a small app with the compression layer installed."""
+
+        self.app = Flask(__name__)
+        init_compression(self.app)
+
+        @self.app.route('/page')
+        def page():
+            return '<div>\n    <p>hello</p>\n</div>\n' * 100
+
+        @self.app.route('/tiny')
+        def tiny():
+            return '<p>hi</p>'
+
+        @self.app.route('/image')
+        def image():
+            return Response(b'\x89PNG' * 500, mimetype='image/png')
+
+        @self.app.route('/stream')
+        def stream():
+            return Response((f'{{"n": {i}}}\n' for i in range(200)),
+                            mimetype='application/x-ndjson')
+
+        self.client = self.app.test_client()
+
+    def test_gzip_html(self):
+        """HTML is minified and gzipped when the client accepts gzip."""
+
+        resp = self.client.get('/page', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', resp.headers['Vary'])
+        self.assertEqual(gzip.decompress(resp.data).decode(),
+                         ' '.join(['<div> <p>hello</p> </div>'] * 100) + '\n')
+
+    def test_no_compression(self):
+        """Tiny bodies, images and clients without gzip are left alone."""
+
+        self.assertNotIn('Content-Encoding', self.client.get('/page').headers)
+
+        resp = self.client.get('/tiny', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', resp.headers)
+
+        resp = self.client.get('/image', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertEqual(resp.data, b'\x89PNG' * 500)
+
+    def test_streamed_response(self):
+        """Streamed bodies are compressed as they are produced."""
+
+        resp = self.client.get('/stream', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        lines = gzip.decompress(resp.data).decode().splitlines()
+        self.assertEqual(len(lines), 200)
+
+    def test_minify_preserves_pre(self):
+        """Whitespace inside <pre> and <textarea> is kept."""
+
+        html = '<div>\n  <pre>  a\n   b</pre>\n  <textarea>\n x</textarea>\n</div>'
+        self.assertEqual(minify_html(html),
+                         '<div> <pre>  a\n   b</pre> <textarea>\n x</textarea> </div>')
+
+    def test_minify_keeps_inline_spacing(self):
+        """Inline elements on separate lines stay separated by a space."""
+
+        html = '<p>\n  <span class="badge">Traded</span>\n  <small>by ann</small>\n</p>'
+        self.assertEqual(minify_html(html),
+                         '<p> <span class="badge">Traded</span> <small>by ann</small> </p>')
@@ -0,0 +1,132 @@
+"""
+Tests for live trade notifications in ArtSwap.
+"""
+
+from datetime import datetime, timedelta
+from unittest import TestCase
+from models import db, User, ArtPiece, Trade, TradeEvent
+
+from app import app, CURR_USER_KEY
+from events import InProcessBroker, publish_trade_event, purge_trade_events
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['TESTING'] = True
+app.config['DEBUG'] = False
+
+
+class EventTestCase(TestCase):
+    """Test trade event publishing and streaming."""
+
+    def setUp(self):
+        """Create sample users, art and a pending trade."""
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        db.drop_all()
+        db.create_all()
+
+        self.broker = InProcessBroker()
+        app.extensions['trade_events'] = self.broker
+
+        self.user1 = User.signup("eventuser1", "e1@test.com", "password")
+        self.user2 = User.signup("eventuser2", "e2@test.com", "password")
+        db.session.commit()
+
+        self.art1 = ArtPiece(title="Art 1", image_url="static/a1.jpg",
+                             user_id=self.user1.id, original_creator_id=self.user1.id)
+        self.art2 = ArtPiece(title="Art 2", image_url="static/a2.jpg",
+                             user_id=self.user2.id, original_creator_id=self.user2.id)
+        db.session.add_all([self.art1, self.art2])
+        db.session.commit()
+
+        self.trade = Trade(sender_id=self.user1.id, receiver_id=self.user2.id,
+                           sender_art_id=self.art1.id, receiver_art_id=self.art2.id,
+                           status="pending")
+        db.session.add(self.trade)
+        db.session.commit()
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        """Clean up any failed transactions."""
+        db.session.rollback()
+        self.ctx.pop()
+
+    def test_accept_publishes_to_both_parties(self):
+        """Accepting a trade notifies sender and receiver after commit."""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user2.id
+            c.post(f'/trade/{self.trade.id}/accept')
+
+        for user_id in (self.user1.id, self.user2.id):
+            events = self.broker.events_since(user_id, 0)
+            self.assertEqual([kind for _, kind, _ in events], ['trade.accepted'])
+            self.assertEqual(events[0][2]['trade_id'], self.trade.id)
+
+    def test_rollback_discards_events(self):
+        """Events queued in a rolled back transaction are never published."""
+
+        publish_trade_event(self.trade, 'trade.rejected')
+        db.session.rollback()
+        db.session.commit()
+
+        self.assertEqual(self.broker.events_since(self.user1.id, 0), [])
+
+    def test_stream_resumes_from_last_event_id(self):
+        """The stream replays only events after Last-Event-ID."""
+
+        first = self.broker.publish(self.user1.id, 'trade.created', {'trade_id': 1})
+        self.broker.publish(self.user1.id, 'trade.accepted', {'trade_id': 1})
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user1.id
+
+            resp = c.get('/events', headers={'Last-Event-ID': str(first)})
+            self.assertEqual(resp.mimetype, 'text/event-stream')
+
+            chunks = iter(resp.response)
+            self.assertTrue(next(chunks).startswith(b'retry:'))
+            self.assertIn(b'event: trade.accepted', next(chunks))
+            resp.close()
+
+    def test_fresh_stream_skips_history(self):
+        """Without Last-Event-ID the stream starts after the newest event."""
+
+        self.broker.publish(self.user1.id, 'trade.created', {'trade_id': 1})
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user1.id
+
+            app.config['EVENTS_HEARTBEAT_SECONDS'] = 0
+            try:
+                resp = c.get('/events')
+                chunks = iter(resp.response)
+                self.assertTrue(next(chunks).startswith(b'retry:'))
+                self.assertEqual(next(chunks), b': heartbeat\n\n')
+                resp.close()
+            finally:
+                app.config['EVENTS_HEARTBEAT_SECONDS'] = 15
+
+    def test_purge_trade_events(self):
+        """Stored events older than the retention period are deleted."""
+
+        db.session.add_all([
+            TradeEvent(user_id=self.user1.id, kind='trade.created', payload='{}',
+                       created_at=datetime.utcnow() - timedelta(days=2)),
+            TradeEvent(user_id=self.user1.id, kind='trade.accepted', payload='{}'),
+        ])
+        db.session.commit()
+
+        self.assertEqual(purge_trade_events(timedelta(days=1)), 1)
+        self.assertEqual([e.kind for e in TradeEvent.query.all()], ['trade.accepted'])
+
+    def test_stream_requires_login(self):
+        """Anonymous users cannot open the event stream."""
+
+        resp = self.client.get('/events')
+        self.assertEqual(resp.status_code, 401)
@@ -0,0 +1,104 @@
+"""
+Tests for gallery filters and facet counts in ArtSwap.
+"""
+
+from datetime import date, datetime, timedelta
+from unittest import TestCase
+from werkzeug.datastructures import MultiDict
+from models import db, User, ArtPiece, Trade
+
+from app import app, CURR_USER_KEY, facet_cache
+from facets import GalleryFilters, facet_counts
+from read_models import recent_art_cards
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['TESTING'] = True
+
+
+class FacetTestCase(TestCase):
+    """Test filtering the gallery and counting facets."""
+
+    def setUp(self):
+        """Create two creators with old, recent and traded pieces."""
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        db.drop_all()
+        db.create_all()
+        facet_cache.clear()
+
+        self.ann = User.signup("ann", "ann@test.com", "password")
+        self.ben = User.signup("ben", "ben@test.com", "password")
+        db.session.commit()
+
+        now = datetime.utcnow()
+        self.art = [
+            ArtPiece(title=title, image_url=f"static/f{i}.jpg", user_id=creator.id,
+                     original_creator_id=creator.id, traded=traded,
+                     created_at=now - timedelta(days=age))
+            for i, (title, creator, traded, age) in enumerate([
+                ("Ann new", self.ann, False, 1),
+                ("Ann old", self.ann, True, 100),
+                ("Ann older", self.ann, False, 400),
+                ("Ben new", self.ben, False, 2),
+            ])
+        ]
+        db.session.add_all(self.art)
+        db.session.commit()
+
+    def tearDown(self):
+        """Clean up any failed transactions."""
+        db.session.rollback()
+        self.ctx.pop()
+
+    def titles(self, **args):
+        filters = GalleryFilters.from_args(MultiDict(args))
+        return [card.title for card in recent_art_cards(limit=10, criteria=filters.criteria())]
+
+    def test_filters(self):
+        """Creator, traded and date filters combine."""
+
+        self.assertEqual(self.titles(creator='ann'), ["Ann new", "Ann old", "Ann older"])
+        self.assertEqual(self.titles(creator='ann', traded='no'), ["Ann new", "Ann older"])
+        self.assertEqual(self.titles(traded='yes'), ["Ann old"])
+        since = (date.today() - timedelta(days=30)).isoformat()
+        self.assertEqual(self.titles(since=since), ["Ann new", "Ben new"])
+        until = (date.today() - timedelta(days=50)).isoformat()
+        self.assertEqual(self.titles(until=until), ["Ann old", "Ann older"])
+        # Nonsense values are ignored rather than failing the page
+        self.assertEqual(len(self.titles(traded='maybe', since='soon')), 4)
+
+    def test_facet_counts(self):
+        """Each facet counts under the other filters only."""
+
+        filters = GalleryFilters(creator='ann', traded=False)
+        facets = facet_counts(filters, facet_cache)
+
+        self.assertEqual(facets['creators'], [("ann", 2), ("ben", 1)])
+        self.assertEqual(facets['traded'], {'traded': 1, 'original': 2})
+        self.assertEqual(facets['dates'], {'week': 1, 'month': 1, 'year': 1, 'all': 2})
+
+    def test_counts_refresh_after_trade(self):
+        """Accepting a trade clears cached counts straight away."""
+
+        client = app.test_client()
+        self.assertIn("Traded <span class=\"badge bg-secondary\">1<",
+                      client.get('/art').get_data(as_text=True))
+
+        trade = Trade(sender_id=self.ann.id, receiver_id=self.ben.id,
+                      sender_art_id=self.art[0].id, receiver_art_id=self.art[3].id,
+                      status='pending')
+        db.session.add(trade)
+        db.session.commit()
+        with client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.ben.id
+            c.post(f'/trade/{trade.id}/accept')
+            with c.session_transaction() as sess:
+                del sess[CURR_USER_KEY]
+
+        html = client.get('/art?creator=ann').get_data(as_text=True)
+        self.assertIn("Traded <span class=\"badge bg-secondary\">2<", html)
+        self.assertIn("Ann new", html)
+        self.assertNotIn("Ben new", html)
@@ -0,0 +1,98 @@
+"""
+Tests for image metadata and placeholders in ArtSwap.
+"""
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase, skipIf
+from models import db, User, ArtPiece
+
+from app import app, CURR_USER_KEY
+from images import Image, extract_image_metadata, backfill_image_metadata
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['TESTING'] = True
+
+
+@skipIf(Image is None, "Pillow is not installed")
+class ImageMetadataTestCase(TestCase):
+    """Test extracting, backfilling and rendering image metadata."""
+
+    def setUp(self):
+        """Write a small solid-colour JPEG and a user to own it."""
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        db.drop_all()
+        db.create_all()
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'red.jpg')
+        Image.new('RGB', (300, 200), (200, 30, 30)).save(self.path)
+
+        self.user = User.signup("painter", "paint@test.com", "password")
+        db.session.commit()
+
+    def tearDown(self):
+        """Clean up any failed transactions and the temporary image."""
+        db.session.rollback()
+        self.ctx.pop()
+        shutil.rmtree(self.tmpdir)
+
+    def test_extract(self):
+        """Size, format, colour and a tiny placeholder are extracted."""
+
+        metadata = extract_image_metadata(self.path)
+
+        self.assertEqual((metadata['image_width'], metadata['image_height']), (300, 200))
+        self.assertEqual(metadata['image_format'], 'jpeg')
+        self.assertEqual(metadata['image_bytes'], os.path.getsize(self.path))
+        r, g, b = (int(metadata['dominant_color'][i:i + 2], 16) for i in (1, 3, 5))
+        self.assertGreater(r, 180)
+        self.assertLess(max(g, b), 50)
+        self.assertTrue(metadata['image_placeholder'].startswith('data:image/'))
+        self.assertLess(len(metadata['image_placeholder']), 1000)
+
+    def test_backfill_and_render(self):
+        """The backfill fills pieces missing metadata; cards reserve their size."""
+
+        pieces = [ArtPiece(title="Red", image_url=self.path, user_id=self.user.id),
+                  ArtPiece(title="Gone", image_url=os.path.join(self.tmpdir, 'gone.jpg'),
+                           user_id=self.user.id)]
+        db.session.add_all(pieces)
+        db.session.commit()
+
+        self.assertEqual(backfill_image_metadata(workers=1), (1, 1))
+
+        red = db.session.get(ArtPiece, pieces[0].id)
+        self.assertEqual(red.image_width, 300)
+        self.assertIsNone(db.session.get(ArtPiece, pieces[1].id).image_bytes)
+
+        html = app.test_client().get('/').get_data(as_text=True)
+        self.assertIn('width="300" height="200"', html)
+        self.assertIn(red.dominant_color, html)
+
+    def test_upload_rejects_decompression_bomb(self):
+        """Images too large to decode are refused without leaving a file behind."""
+
+        app.config['WTF_CSRF_ENABLED'] = False
+        upload_dir = app.config['UPLOAD_FOLDER']
+        before = set(os.listdir(upload_dir))
+        max_pixels = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = 1000
+        try:
+            with app.test_client() as c:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = self.user.id
+                with open(self.path, 'rb') as f:
+                    resp = c.post('/art/new', data={'title': "Huge", 'image': (f, 'huge.jpg')},
+                                  content_type='multipart/form-data')
+        finally:
+            Image.MAX_IMAGE_PIXELS = max_pixels
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("could not be read as an image", resp.get_data(as_text=True))
+        self.assertEqual(set(os.listdir(upload_dir)), before)
+        self.assertEqual(ArtPiece.query.count(), 0)
@@ -0,0 +1,79 @@
+"""
+Tests for bulk artwork import in ArtSwap.
+"""
+
+import os
+import shutil
+import tempfile
+import zipfile
+from unittest import TestCase, skipIf
+from models import db, User, ArtPiece, OwnershipEvent
+
+from app import app
+from images import Image
+from importer import open_source, find_manifest, read_manifest, import_entries
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['TESTING'] = True
+
+
+@skipIf(Image is None, "Pillow is not installed")
+class ImporterTestCase(TestCase):
+    """Test importing an archive of artwork with a manifest."""
+
+    def setUp(self):
+        """Build a zip of images with a CSV manifest."""
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        db.drop_all()
+        db.create_all()
+
+        self.user = User.signup("prolific", "pro@test.com", "password")
+        db.session.commit()
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.upload_folder = app.config['UPLOAD_FOLDER']
+        app.config['UPLOAD_FOLDER'] = os.path.join(self.tmpdir, 'uploads')
+
+        self.archive = os.path.join(self.tmpdir, 'portfolio.zip')
+        with zipfile.ZipFile(self.archive, 'w') as archive:
+            for i, colour in enumerate([(255, 0, 0), (0, 255, 0), (255, 0, 0)]):
+                path = os.path.join(self.tmpdir, f'{i}.png')
+                Image.new('RGB', (40, 30), colour).save(path)
+                archive.write(path, f'art/{i}.png')
+            archive.writestr('art/broken.png', b'not an image')
+            archive.writestr('manifest.csv', "file,title,description\n"
+                             "art/0.png,Red,First\n"
+                             "art/1.png,Green,\n"
+                             "art/2.png,Red again,Same pixels as Red\n"
+                             "art/broken.png,Broken,\n"
+                             "../escape.png,Escape,\n")
+
+    def tearDown(self):
+        """Clean up any failed transactions and temporary files."""
+        db.session.rollback()
+        self.ctx.pop()
+        app.config['UPLOAD_FOLDER'] = self.upload_folder
+        shutil.rmtree(self.tmpdir)
+
+    def run_import(self):
+        with open_source(self.archive) as root:
+            entries = read_manifest(find_manifest(root))
+            return import_entries(root, entries, self.user, workers=1, batch_size=2)
+
+    def test_import_and_resume(self):
+        """Valid images are imported once, with ledger rows; reruns add nothing."""
+
+        imported, skipped, errors = self.run_import()
+
+        self.assertEqual((imported, skipped, len(errors)), (2, 1, 2))
+        pieces = ArtPiece.query.order_by(ArtPiece.id).all()
+        self.assertEqual([p.title for p in pieces], ["Red", "Green"])
+        self.assertEqual(pieces[0].image_width, 40)
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir, pieces[0].image_url)))
+        self.assertEqual(OwnershipEvent.query.filter_by(kind='created').count(), 2)
+
+        self.assertEqual(self.run_import(), (0, 3, errors))
+        self.assertEqual(ArtPiece.query.count(), 2)
@@ -0,0 +1,144 @@
+"""
+Tests for the background job queue in ArtSwap.
+"""
+
+from datetime import datetime, timedelta
+from unittest import TestCase
+from models import db, User, Job
+
+from app import app, CURR_USER_KEY
+from jobs import (HANDLERS, enqueue, claim_job, run_job, work, queue_metrics,
+                  purge_finished_jobs)
+
+app.config['TESTING'] = True
+
+
+class JobQueueTestCase(TestCase):
+    """Test enqueueing, claiming and retrying jobs."""
+
+    def setUp(self):
+        """Start with an empty queue and a recording handler."""
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        db.drop_all()
+        db.create_all()
+
+        self.calls = []
+        HANDLERS['test.record'] = lambda **payload: self.calls.append(payload)
+
+    def tearDown(self):
+        """Clean up any failed transactions."""
+        db.session.rollback()
+        HANDLERS.pop('test.record', None)
+        HANDLERS.pop('test.fail', None)
+        self.ctx.pop()
+
+    def test_job_only_exists_after_commit(self):
+        """A job enqueued in a rolled back transaction never runs."""
+
+        enqueue('test.record', {'n': 1})
+        db.session.rollback()
+
+        work('test-worker', burst=True)
+        self.assertEqual(self.calls, [])
+        self.assertEqual(Job.query.count(), 0)
+
+    def test_run_job(self):
+        """Committed jobs are claimed, run and marked done."""
+
+        enqueue('test.record', {'n': 1})
+        db.session.commit()
+
+        work('test-worker', burst=True)
+        self.assertEqual(self.calls, [{'n': 1}])
+        self.assertEqual(Job.query.one().status, 'done')
+        self.assertEqual(queue_metrics()['depth']['done'], 1)
+
+    def test_dedupe_key(self):
+        """An unfinished job with the same dedupe key is reused."""
+
+        first = enqueue('test.record', dedupe_key='same')
+        second = enqueue('test.record', dedupe_key='same')
+        db.session.commit()
+
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(Job.query.count(), 1)
+
+    def test_retry_with_backoff(self):
+        """Failing jobs are rescheduled, then marked failed."""
+
+        def fail():
+            raise RuntimeError("boom")
+
+        HANDLERS['test.fail'] = fail
+        enqueue('test.fail', max_attempts=2)
+        db.session.commit()
+
+        run_job(claim_job('test-worker'))
+        job = Job.query.one()
+        self.assertEqual(job.status, 'queued')
+        self.assertGreater(job.run_at, job.started_at)
+        self.assertIn("boom", job.last_error)
+
+        # Not due yet, so nothing is claimed
+        self.assertIsNone(claim_job('test-worker'))
+
+        job.run_at = job.started_at
+        db.session.commit()
+        run_job(claim_job('test-worker'))
+        self.assertEqual(Job.query.one().status, 'failed')
+
+    def test_worker_requeues_stale_jobs(self):
+        """A job left running by a dead worker is picked up again."""
+
+        enqueue('test.record', {'n': 1})
+        db.session.commit()
+        claim_job('dead-worker')
+        job = Job.query.one()
+        job.locked_at = datetime.utcnow() - timedelta(
+            seconds=app.config['JOBS_LOCK_TIMEOUT_SECONDS'] + 1)
+        db.session.commit()
+
+        work('test-worker', burst=True)
+        self.assertEqual(self.calls, [{'n': 1}])
+        self.assertEqual(Job.query.one().status, 'done')
+
+    def test_purge_finished_jobs(self):
+        """Only done jobs older than the retention period are deleted."""
+
+        old = datetime.utcnow() - timedelta(days=10)
+        db.session.add_all([
+            Job(name='old', status='done', finished_at=old),
+            Job(name='failed', status='failed', finished_at=old),
+            Job(name='recent', status='done', finished_at=datetime.utcnow()),
+        ])
+        db.session.commit()
+
+        self.assertEqual(purge_finished_jobs(timedelta(days=7), batch_size=1), 1)
+        self.assertEqual(sorted(job.name for job in Job.query), ['failed', 'recent'])
+
+    def test_metrics_endpoint_access(self):
+        """Queue metrics are only for admins and holders of the metrics token."""
+
+        client = app.test_client()
+        self.assertEqual(client.get('/metrics/jobs').status_code, 403)
+
+        app.config['METRICS_TOKEN'] = 's3cret'
+        try:
+            resp = client.get('/metrics/jobs', headers={'Authorization': 'Bearer wrong'})
+            self.assertEqual(resp.status_code, 403)
+            resp = client.get('/metrics/jobs', headers={'Authorization': 'Bearer s3cret'})
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn('depth', resp.get_json())
+        finally:
+            app.config['METRICS_TOKEN'] = None
+
+        admin = User.signup("jobadmin", "ja@test.com", "password")
+        admin.is_admin = True
+        db.session.commit()
+        with client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = admin.id
+            self.assertEqual(c.get('/metrics/jobs').status_code, 200)
@@ -0,0 +1,142 @@
+"""
+Tests for the ownership provenance ledger in ArtSwap.
+"""
+
+from unittest import TestCase
+from models import db, User, ArtPiece, Trade, OwnershipEvent
+
+from app import app, CURR_USER_KEY
+from provenance import (record_creation, ownership_chain, ownership_chains,
+                        backfill_ownership_events)
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['TESTING'] = True
+
+
+class ProvenanceTestCase(TestCase):
+    """Test recording and reading ownership chains."""
+
+    def setUp(self):
+        """Create three users with one recorded piece each."""
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        db.drop_all()
+        db.create_all()
+
+        self.users = [User.signup(f"owner{i}", f"o{i}@test.com", "password")
+                      for i in range(3)]
+        db.session.commit()
+
+        self.art = [ArtPiece(title=f"Art {i}", image_url=f"static/o{i}.jpg",
+                             user_id=user.id, original_creator_id=user.id)
+                    for i, user in enumerate(self.users)]
+        for art in self.art:
+            db.session.add(art)
+            record_creation(art)
+        db.session.commit()
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        """Clean up any failed transactions."""
+        db.session.rollback()
+        self.ctx.pop()
+
+    def trade(self, sender, receiver, sender_art, receiver_art):
+        """Create a trade and accept it as the receiver."""
+
+        trade = Trade(sender_id=sender.id, receiver_id=receiver.id,
+                      sender_art_id=sender_art.id, receiver_art_id=receiver_art.id,
+                      status='pending')
+        db.session.add(trade)
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = receiver.id
+            c.post(f'/trade/{trade.id}/accept')
+        return trade
+
+    def test_chain_across_trades(self):
+        """A piece traded twice keeps its whole history."""
+
+        u0, u1, u2 = self.users
+        a0, a1, a2 = self.art
+        self.trade(u0, u1, a0, a1)   # a0 -> u1
+        self.trade(u1, u2, a0, a2)   # a0 -> u2
+
+        chain = ownership_chain(a0.id)
+        self.assertEqual([entry.owner_username for entry in chain],
+                         ['owner0', 'owner1', 'owner2'])
+        self.assertEqual([entry.kind for entry in chain], ['created', 'traded', 'traded'])
+        self.assertEqual(db.session.get(ArtPiece, a0.id).previous_owner().id, u1.id)
+
+        chains = ownership_chains([a1.id, a2.id])
+        self.assertEqual([e.owner_id for e in chains[a1.id]], [u1.id, u0.id])
+        self.assertEqual([e.owner_id for e in chains[a2.id]], [u2.id, u1.id])
+
+    def test_stale_offer_expires(self):
+        """An offer for a piece that has since changed hands is not swapped."""
+
+        u0, u1, u2 = self.users
+        a0, a1, a2 = self.art
+        to_u1 = Trade(sender_id=u0.id, receiver_id=u1.id,
+                      sender_art_id=a0.id, receiver_art_id=a1.id, status='pending')
+        db.session.add(to_u1)
+        db.session.commit()
+
+        # u0 offers the same piece to u2 and u1 accepts first
+        self.trade(u0, u2, a0, a2)
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = u1.id
+            c.post(f'/trade/{to_u1.id}/accept')
+
+        self.assertEqual(db.session.get(Trade, to_u1.id).status, 'expired')
+        self.assertEqual(db.session.get(ArtPiece, a0.id).user_id, u2.id)
+        self.assertEqual(db.session.get(ArtPiece, a1.id).user_id, u1.id)
+        self.assertEqual([e.owner_id for e in ownership_chain(a0.id)], [u0.id, u2.id])
+        self.assertEqual([e.owner_id for e in ownership_chain(a1.id)], [u1.id])
+
+    def test_ledger_is_append_only(self):
+        """Ledger rows cannot be changed once written."""
+
+        event = OwnershipEvent.query.first()
+        event.owner_id = self.users[1].id
+        with self.assertRaises(ValueError):
+            db.session.commit()
+
+    def test_backfill(self):
+        """Pieces without ledger entries are rebuilt from accepted trades."""
+
+        u0, u1, _ = self.users
+        a0, a1, _ = self.art
+        self.trade(u0, u1, a0, a1)
+
+        db.session.execute(OwnershipEvent.__table__.delete())
+        db.session.commit()
+
+        self.assertEqual(backfill_ownership_events(batch_size=2), 3)
+        self.assertEqual([e.owner_id for e in ownership_chain(a0.id)], [u0.id, u1.id])
+        self.assertEqual([e.owner_id for e in ownership_chain(a1.id)], [u1.id, u0.id])
+
+        # Running again finds nothing left to do
+        self.assertEqual(backfill_ownership_events(), 0)
+
+    def test_trade_before_backfill(self):
+        """Trading a piece that predates the ledger records its creation first."""
+
+        u0, u1, _ = self.users
+        a0, a1, _ = self.art
+        db.session.execute(OwnershipEvent.__table__.delete())
+        db.session.commit()
+
+        self.trade(u0, u1, a0, a1)
+        self.assertEqual(backfill_ownership_events(), 1)
+
+        chain = ownership_chain(a0.id)
+        self.assertEqual([(e.seq, e.owner_id, e.kind) for e in chain],
+                         [(1, u0.id, 'created'), (2, u1.id, 'traded')])
+        self.assertEqual([e.owner_id for e in ownership_chain(a1.id)], [u1.id, u0.id])
@@ -0,0 +1,94 @@
+"""
+Tests for the listing-page read models in ArtSwap.
+"""
+
+from datetime import datetime, timedelta
+from unittest import TestCase
+from models import db, User, ArtPiece, Trade
+
+from app import app, CURR_USER_KEY, GALLERY_PAGE_SIZE
+from read_models import dashboard_panels, recent_art_cards
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['TESTING'] = True
+
+
+class ReadModelTestCase(TestCase):
+    """Test the read models and the pages built from them."""
+
+    def setUp(self):
+        """Create two users, their art and a trade in each state."""
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        db.drop_all()
+        db.create_all()
+
+        self.alice = User.signup("alice", "alice@test.com", "password")
+        self.bob = User.signup("bob", "bob@test.com", "password")
+        db.session.commit()
+
+        start = datetime.utcnow() - timedelta(days=1)
+        self.art = [
+            ArtPiece(title=f"Piece {i}", description="Long description " * 10,
+                     image_url=f"static/r{i}.jpg", created_at=start + timedelta(minutes=i),
+                     user_id=owner.id, original_creator_id=owner.id)
+            for i, owner in enumerate([self.alice, self.bob] * (GALLERY_PAGE_SIZE // 2 + 1))
+        ]
+        db.session.add_all(self.art)
+        db.session.commit()
+
+        for status, sender, receiver in [('pending', self.bob, self.alice),
+                                         ('pending', self.alice, self.bob),
+                                         ('accepted', self.alice, self.bob)]:
+            db.session.add(Trade(
+                sender_id=sender.id, receiver_id=receiver.id, status=status,
+                sender_art_id=next(a.id for a in self.art if a.user_id == sender.id),
+                receiver_art_id=next(a.id for a in self.art if a.user_id == receiver.id)
+            ))
+        db.session.commit()
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        """Clean up any failed transactions."""
+        db.session.rollback()
+        self.ctx.pop()
+
+    def test_dashboard_panels(self):
+        """Panels hold compact views with their related names resolved."""
+
+        panels = dashboard_panels(self.alice.id)
+
+        self.assertEqual(len(panels['user_art']), GALLERY_PAGE_SIZE // 2 + 1)
+        self.assertEqual(panels['user_art'][0].creator.username, "alice")
+        self.assertLessEqual(len(panels['user_art'][0].description), 60)
+
+        incoming, = panels['incoming_trades']
+        self.assertEqual((incoming.sender.username, incoming.offered_art.title),
+                         ("bob", "Piece 1"))
+        self.assertEqual(len(panels['outgoing_trades']), 1)
+        self.assertTrue(panels['trade_history'][0].is_accepted)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.alice.id
+            html = c.get('/dashboard').get_data(as_text=True)
+        self.assertIn("From bob", html)
+        self.assertIn('You offered "Piece 0" for "Piece 1"', html)
+        self.assertIn("Long description Long description Long...", html)
+
+    def test_gallery_pages(self):
+        """The gallery lists newest first, a page at a time."""
+
+        self.assertEqual([card.title for card in recent_art_cards(limit=2)],
+                         [self.art[-1].title, self.art[-2].title])
+
+        html = self.client.get('/art').get_data(as_text=True)
+        self.assertIn(self.art[-1].title, html)
+        self.assertIn('page=2', html)
+
+        html = self.client.get('/art?page=2').get_data(as_text=True)
+        self.assertIn(f"{self.art[1].title}<", html)
+        self.assertNotIn('page=3', html)
@@ -0,0 +1,122 @@
+"""
+Tests for read-replica routing in ArtSwap.
+
+Two SQLite files stand in for the primary and its replica. Each holds a
+different user so the tests can tell which database answered.
+"""
+
+import os
+import tempfile
+from unittest import TestCase
+
+from flask import Flask
+from sqlalchemy import update
+from models import db, connect_db, User
+from replicas import init_replicas, read_only, use_primary, STICKY_KEY
+
+
+class ReplicaRoutingTestCase(TestCase):
+    """Test which database reads and writes are sent to."""
+
+    def setUp(self):
+        """Create an app with a primary and one replica."""
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        primary = os.path.join(self.tmpdir.name, 'primary.db')
+        replica = os.path.join(self.tmpdir.name, 'replica.db')
+
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{primary}'
+        self.app.config['SQLALCHEMY_REPLICA_URIS'] = [f'sqlite:///{replica}']
+        self.app.config['SECRET_KEY'] = 'test'
+        init_replicas(self.app)
+        connect_db(self.app)
+
+        @self.app.route('/whoami', methods=['GET', 'POST'])
+        def whoami():
+            return User.query.one().username
+
+        @self.app.route('/write', methods=['POST'])
+        def write():
+            User.query.one().email = 'changed@test.com'
+            db.session.commit()
+            return 'ok'
+
+        @self.app.route('/rename')
+        def rename():
+            db.session.execute(update(User).values(email='renamed@test.com'))
+            db.session.commit()
+            return User.query.one().email
+
+        with self.app.app_context():
+            db.create_all()
+            db.metadata.create_all(db.engines['replica_0'])
+            with db.engines[None].begin() as conn:
+                conn.execute(User.__table__.insert().values(
+                    username='on_primary', email='p@test.com', password_hash='x'))
+            with db.engines['replica_0'].begin() as conn:
+                conn.execute(User.__table__.insert().values(
+                    username='on_replica', email='r@test.com', password_hash='x'))
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        """Dispose engines and remove the database files."""
+        with self.app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+        # Bind metadata is shared by every app using db
+        db.metadatas.pop('replica_0', None)
+        self.tmpdir.cleanup()
+
+    def test_get_reads_from_replica(self):
+        """GET requests read from the replica."""
+        self.assertEqual(self.client.get('/whoami').data, b'on_replica')
+
+    def test_post_reads_from_primary(self):
+        """Other methods read from the primary."""
+        self.assertEqual(self.client.post('/whoami').data, b'on_primary')
+
+    def test_sticky_after_write(self):
+        """A browser that just wrote reads from the primary."""
+
+        with self.client as c:
+            c.post('/write')
+            with c.session_transaction() as sess:
+                self.assertIn(STICKY_KEY, sess)
+            self.assertEqual(c.get('/whoami').data, b'on_primary')
+
+            with c.session_transaction() as sess:
+                sess[STICKY_KEY] = 0
+            self.assertEqual(c.get('/whoami').data, b'on_replica')
+
+    def test_explicit_routing(self):
+        """read_only() and use_primary() override the defaults."""
+
+        with self.app.app_context():
+            with read_only(db.session):
+                self.assertEqual(User.query.one().username, 'on_replica')
+            db.session.rollback()
+            self.assertEqual(User.query.one().username, 'on_primary')
+
+        with self.app.test_request_context('/', method='GET'):
+            with use_primary(db.session):
+                self.assertEqual(User.query.one().username, 'on_primary')
+
+    def test_statements_write_to_primary(self):
+        """INSERT/UPDATE/DELETE statements go to the primary and pin the browser."""
+
+        with self.client as c:
+            # Even from a GET request, the write and the reads after it
+            self.assertEqual(c.get('/rename').data, b'renamed@test.com')
+            with c.session_transaction() as sess:
+                self.assertIn(STICKY_KEY, sess)
+
+        with self.app.app_context():
+            with read_only(db.session):
+                db.session.execute(update(User).values(username='renamed'))
+                self.assertEqual(User.query.one().username, 'renamed')
+            db.session.commit()
+            with db.engines['replica_0'].connect() as conn:
+                self.assertEqual(conn.execute(User.__table__.select()).one().username,
+                                 'on_replica')
@@ -0,0 +1,122 @@
+"""
+Tests for incremental trade statistics in ArtSwap.
+"""
+
+from datetime import datetime, timedelta
+from unittest import TestCase
+from models import db, User, ArtPiece, Trade, ArtTradeCount
+
+from app import app, CURR_USER_KEY
+from rollups import (rollup_trade_stats, site_stats, user_stats,
+                     decision_bucket, approximate_median, HISTOGRAM_BUCKETS)
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['TESTING'] = True
+
+
+class RollupTestCase(TestCase):
+    """Test maintaining and reading the trade rollups."""
+
+    def setUp(self):
+        """Create two traders with a few pieces and trades from yesterday."""
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        db.drop_all()
+        db.create_all()
+
+        self.alice = User.signup("alice", "alice@test.com", "password")
+        self.bob = User.signup("bob", "bob@test.com", "password")
+        db.session.commit()
+
+        self.art = [ArtPiece(title=f"Piece {i}", image_url=f"static/s{i}.jpg",
+                             user_id=owner.id, original_creator_id=owner.id)
+                    for i, owner in enumerate([self.alice, self.bob] * 2)]
+        db.session.add_all(self.art)
+        db.session.commit()
+
+        yesterday = datetime.utcnow() - timedelta(days=1)
+        self.trades = [
+            self.trade(self.alice, self.bob, 0, 1, 'accepted', yesterday, minutes=10),
+            self.trade(self.alice, self.bob, 2, 1, 'rejected', yesterday, minutes=30),
+            self.trade(self.bob, self.alice, 3, 0, 'expired', yesterday, minutes=60 * 24),
+            self.trade(self.bob, self.alice, 1, 2, 'pending', yesterday),
+        ]
+        db.session.commit()
+
+    def tearDown(self):
+        """Clean up any failed transactions."""
+        db.session.rollback()
+        self.ctx.pop()
+
+    def trade(self, sender, receiver, sender_art, receiver_art, status, created, minutes=0):
+        trade = Trade(sender_id=sender.id, receiver_id=receiver.id,
+                      sender_art_id=self.art[sender_art].id,
+                      receiver_art_id=self.art[receiver_art].id, status=status,
+                      created_at=created, updated_at=created + timedelta(minutes=minutes))
+        db.session.add(trade)
+        return trade
+
+    def test_histogram_median(self):
+        """The median is read from power-of-two buckets."""
+
+        histogram = [0] * HISTOGRAM_BUCKETS
+        for seconds in (600, 1800):
+            histogram[decision_bucket(seconds)] += 1
+        median = approximate_median(histogram)
+        self.assertTrue(512 <= median < 2048)
+        self.assertIsNone(approximate_median([0] * HISTOGRAM_BUCKETS))
+
+    def test_incremental_rollup(self):
+        """Each offer and decision is counted once, however often it runs."""
+
+        self.assertEqual(rollup_trade_stats(lag=0, batch_size=2), 4 + 3)
+        self.assertEqual(rollup_trade_stats(lag=0, batch_size=2), 0)
+
+        stats = site_stats(days=7)
+        self.assertEqual((stats['offers'], stats['accepted'], stats['rejected'],
+                          stats['expired']), (4, 1, 1, 1))
+        self.assertAlmostEqual(stats['acceptance_rate'], 1 / 3)
+        self.assertTrue(512 <= stats['median_decision_seconds'] < 2048)
+        self.assertEqual({p['art_id'] for p in stats['most_traded']},
+                         {self.art[0].id, self.art[1].id})
+
+        # Bob accepts the pending offer; only the decision is new
+        pending = db.session.get(Trade, self.trades[3].id)
+        pending.status = 'accepted'
+        db.session.commit()
+        self.assertEqual(rollup_trade_stats(lag=0), 1)
+
+        stats = user_stats(self.alice.id, days=7)
+        self.assertEqual((stats['offers_sent'], stats['offers_received']), (2, 2))
+        self.assertEqual(stats['accepted'], 2)
+        self.assertEqual(db.session.get(ArtTradeCount, self.art[1].id).trades, 2)
+
+    def test_trades_inside_lag_wait(self):
+        """Trades newer than the safety lag are left for the next run."""
+
+        self.trade(self.alice, self.bob, 0, 3, 'pending', datetime.utcnow())
+        db.session.commit()
+
+        rollup_trade_stats(lag=3600)
+        self.assertEqual(site_stats(days=7)['offers'], 4)
+        rollup_trade_stats(lag=0)
+        self.assertEqual(site_stats(days=7)['offers'], 5)
+
+    def test_admin_only(self):
+        """Stats pages are only for admins."""
+
+        rollup_trade_stats(lag=0)
+        client = app.test_client()
+        with client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.alice.id
+            self.assertEqual(c.get('/admin/stats').status_code, 302)
+            self.assertEqual(c.get('/admin/stats.json').status_code, 403)
+
+            self.alice.is_admin = True
+            db.session.commit()
+            self.assertIn("Most Traded Pieces", c.get('/admin/stats').get_data(as_text=True))
+            data = c.get('/admin/stats.json?user=bob').get_json()
+            self.assertEqual((data['user'], data['offers_sent']), ("bob", 2))
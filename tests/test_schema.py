@@ -0,0 +1,77 @@
+"""
+Tests for upgrading existing ArtSwap databases in place.
+"""
+
+from unittest import TestCase
+from sqlalchemy import inspect
+from models import db, User, ArtPiece, Trade
+
+from app import app
+from schema import upgrade_schema
+
+app.config['TESTING'] = True
+
+# Schema objects added since the original release, removed to fake an old database
+NEW_INDEXES = ['uq_trades_pending_offer', 'ix_art_pieces_created_at',
+               'ix_art_pieces_user_id_created_at', 'ix_art_pieces_traded_created_at',
+               'ix_art_pieces_original_creator_id_created_at']
+NEW_COLUMNS = [('users', 'is_admin'), ('art_pieces', 'updated_at'),
+               ('art_pieces', 'image_width'), ('art_pieces', 'dominant_color')]
+
+
+class SchemaUpgradeTestCase(TestCase):
+    """Test `flask upgrade-db` against a database missing newer columns."""
+
+    def setUp(self):
+        """Create the current schema, then strip it back to an older one."""
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        db.drop_all()
+        db.create_all()
+        with db.engine.begin() as conn:
+            for name in NEW_INDEXES:
+                conn.exec_driver_sql(f"DROP INDEX {name}")
+            for table, column in NEW_COLUMNS:
+                conn.exec_driver_sql(f"ALTER TABLE {table} DROP COLUMN {column}")
+            conn.exec_driver_sql(
+                "INSERT INTO users (id, username, email, password_hash) "
+                "VALUES (1, 'old', 'old@test.com', 'x'), (2, 'other', 'o@test.com', 'x')")
+            conn.exec_driver_sql(
+                "INSERT INTO art_pieces (id, title, image_url, user_id, created_at) "
+                "VALUES (1, 'Old art', 'static/old.jpg', 1, '2020-01-01 00:00:00'), "
+                "(2, 'Their art', 'static/their.jpg', 2, '2020-01-01 00:00:00')")
+            # Duplicate pending offers were possible before the unique index
+            conn.exec_driver_sql(
+                "INSERT INTO trades (sender_id, receiver_id, sender_art_id, receiver_art_id, status) "
+                "VALUES (1, 2, 1, 2, 'pending'), (1, 2, 1, 2, 'pending')")
+
+    def tearDown(self):
+        """Clean up any failed transactions."""
+        db.session.rollback()
+        db.drop_all()
+        db.create_all()
+        self.ctx.pop()
+
+    def test_upgrade_keeps_data(self):
+        """Missing columns and indexes are added without losing rows."""
+
+        changes = upgrade_schema()
+
+        self.assertEqual(sorted(changes['columns']),
+                         sorted(f"{table}.{column}" for table, column in NEW_COLUMNS))
+        self.assertEqual(sorted(changes['indexes']), sorted(NEW_INDEXES))
+        self.assertEqual(changes['expired_offers'], 1)
+
+        art = db.session.get(ArtPiece, 1)
+        self.assertEqual(art.title, 'Old art')
+        self.assertEqual(art.updated_at, art.created_at)
+        self.assertFalse(db.session.get(User, 1).is_admin)
+        self.assertEqual(sorted(t.status for t in Trade.query), ['expired', 'pending'])
+        self.assertIn('uq_trades_pending_offer',
+                      {index['name'] for index in inspect(db.engine).get_indexes('trades')})
+
+        # Running it again changes nothing
+        self.assertEqual(upgrade_schema(),
+                         {'columns': [], 'indexes': [], 'expired_offers': 0})
@@ -0,0 +1,42 @@
+"""
+Tests for template render profiling in ArtSwap.
+"""
+
+from unittest import TestCase
+
+from flask import Flask, g
+from jinja2 import DictLoader, Environment
+
+from templating import ProfiledTemplate, precompile_templates
+
+
+class TemplateProfilingTestCase(TestCase):
+    """Test per-template render timing."""
+
+    def test_time_is_charged_per_template(self):
+        """Extended and included templates get their own entries."""
+
+        env = Environment(loader=DictLoader({
+            'base.html': '<main>{% block content %}{% endblock %}</main>',
+            'card.html': '<div>{{ item }}</div>',
+            'page.html': ("{% extends 'base.html' %}{% block content %}"
+                          "{% for item in items %}{% include 'card.html' %}{% endfor %}"
+                          "{% endblock %}"),
+        }))
+        env.template_class = ProfiledTemplate
+
+        with Flask(__name__).app_context():
+            g.template_timings = {}
+            g.template_stack = []
+            html = env.get_template('page.html').render(items=range(3))
+
+            self.assertEqual(html.count('<div>'), 3)
+            self.assertEqual(set(g.template_timings), {'page.html', 'base.html', 'card.html'})
+            self.assertEqual(g.template_timings['card.html']['calls'], 3)
+            self.assertEqual(g.template_stack, [])
+
+    def test_precompile_templates(self):
+        """Every app template can be compiled ahead of time."""
+
+        from app import app
+        self.assertGreater(precompile_templates(app), 5)
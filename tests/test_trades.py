@@ -0,0 +1,251 @@
+"""
+Tests for trade offers in ArtSwap.
+"""
+
+import os
+import tempfile
+from datetime import datetime, timedelta
+from unittest import TestCase
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
+from models import db, User, ArtPiece, Trade, Job, IdempotencyKey
+
+from app import app, CURR_USER_KEY, ART_PICKER_PAGE_SIZE
+from expiry import expire_stale_trades, schedule_expiry
+from idempotency import request_fingerprint
+from jobs import work
+from replicas import STICKY_KEY
+
+app.config['WTF_CSRF_ENABLED'] = False
+app.config['TESTING'] = True
+
+
+class TradeTestCase(TestCase):
+    """Test the artwork picker, trade creation, idempotency and expiry."""
+
+    def setUp(self):
+        """Create a collector with many pieces and an artist with one."""
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        db.drop_all()
+        db.create_all()
+
+        self.collector = User.signup("collector", "col@test.com", "password")
+        self.artist = User.signup("artist", "art@test.com", "password")
+        db.session.commit()
+
+        self.collection = [
+            ArtPiece(title=f"Piece {i:03d}", image_url=f"static/p{i}.jpg",
+                     user_id=self.collector.id, original_creator_id=self.collector.id)
+            for i in range(ART_PICKER_PAGE_SIZE + 5)
+        ]
+        self.wanted = ArtPiece(title="Wanted", image_url="static/wanted.jpg",
+                               user_id=self.artist.id, original_creator_id=self.artist.id)
+        db.session.add_all(self.collection + [self.wanted])
+        db.session.commit()
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        """Clean up any failed transactions."""
+        db.session.rollback()
+        self.ctx.pop()
+
+    def login(self, client, user):
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user.id
+
+    def test_art_search(self):
+        """The picker endpoint pages and filters the user's own pieces."""
+
+        with self.client as c:
+            self.login(c, self.collector)
+
+            data = c.get('/art/mine.json').get_json()
+            self.assertEqual(len(data['results']), ART_PICKER_PAGE_SIZE)
+            self.assertTrue(data['has_more'])
+
+            data = c.get('/art/mine.json?page=2').get_json()
+            self.assertEqual(len(data['results']), 5)
+            self.assertFalse(data['has_more'])
+
+            data = c.get('/art/mine.json?q=piece 01').get_json()
+            self.assertEqual([r['title'] for r in data['results']],
+                             [f"Piece 01{i}" for i in range(10)])
+
+            data = c.get('/art/mine.json?q=Wanted').get_json()
+            self.assertEqual(data['results'], [])
+
+    def test_offer_piece_beyond_first_page(self):
+        """Any owned piece can be offered, not just those in the initial list."""
+
+        last = self.collection[-1]
+        with self.client as c:
+            self.login(c, self.collector)
+            resp = c.post('/trade/new', data={
+                'sender_art_id': last.id,
+                'receiver_art_id': self.wanted.id
+            })
+
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(Trade.query.one().sender_art_id, last.id)
+
+    def test_cannot_offer_others_art(self):
+        """Offering a piece the user does not own is refused."""
+
+        with self.client as c:
+            self.login(c, self.artist)
+            resp = c.post('/trade/new', data={
+                'sender_art_id': self.collection[0].id,
+                'receiver_art_id': self.wanted.id
+            }, follow_redirects=True)
+
+        self.assertIn("You can only offer your own artwork.", resp.get_data(as_text=True))
+        self.assertEqual(Trade.query.count(), 0)
+
+    def offer(self, client, headers=None, piece=0):
+        return client.post('/trade/new', headers=headers, data={
+            'sender_art_id': self.collection[piece].id,
+            'receiver_art_id': self.wanted.id
+        })
+
+    def test_duplicate_pending_offer(self):
+        """The same pending offer can only exist once."""
+
+        with self.client as c:
+            self.login(c, self.collector)
+            self.offer(c)
+            resp = self.offer(c)
+
+        self.assertEqual(resp.location, f'/art/{self.wanted.id}')
+        self.assertEqual(Trade.query.count(), 1)
+
+        db.session.add(Trade(sender_id=self.collector.id, receiver_id=self.artist.id,
+                             sender_art_id=self.collection[0].id,
+                             receiver_art_id=self.wanted.id, status='pending'))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
+
+        # Once answered, the same offer may be made again
+        Trade.query.update({'status': 'rejected'})
+        db.session.commit()
+        with self.client as c:
+            self.login(c, self.collector)
+            self.assertEqual(self.offer(c).location, '/dashboard')
+        self.assertEqual(Trade.query.filter_by(status='pending').count(), 1)
+
+    def test_offer_reads_back_from_primary(self):
+        """After sending an offer the browser reads the primary, not a stale replica."""
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            replica_path = os.path.join(tmpdir, 'replica.db')
+            with db.engine.connect() as conn:
+                conn.exec_driver_sql(f"VACUUM INTO '{replica_path}'")
+            replica = create_engine(f'sqlite:///{replica_path}')
+            db.engines['replica_0'] = replica
+            try:
+                with self.client as c:
+                    self.login(c, self.collector)
+                    self.assertEqual(self.offer(c).status_code, 302)
+                    with c.session_transaction() as sess:
+                        self.assertIn(STICKY_KEY, sess)
+                    html = c.get('/dashboard').get_data(as_text=True)
+                self.assertNotIn("No pending outgoing trade requests", html)
+            finally:
+                del db.engines['replica_0']
+                replica.dispose()
+
+    def test_idempotency_key(self):
+        """Retries with the same key replay the first response."""
+
+        with self.client as c:
+            self.login(c, self.collector)
+            first = self.offer(c, headers={'Idempotency-Key': 'offer-1'})
+            # Answered meanwhile, so only a replay avoids a second trade
+            Trade.query.update({'status': 'rejected'})
+            db.session.commit()
+            retry = self.offer(c, headers={'Idempotency-Key': 'offer-1'})
+            other = self.offer(c, headers={'Idempotency-Key': 'offer-1'}, piece=1)
+
+        self.assertEqual(Trade.query.count(), 1)
+        self.assertEqual((retry.status_code, retry.location), (first.status_code, first.location))
+        self.assertEqual(retry.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(other.status_code, 422)
+
+    def test_idempotent_accept(self):
+        """A retried accept does not swap the pieces back."""
+
+        trade = Trade(sender_id=self.collector.id, receiver_id=self.artist.id,
+                      sender_art_id=self.collection[0].id,
+                      receiver_art_id=self.wanted.id, status='pending')
+        db.session.add(trade)
+        db.session.commit()
+
+        with self.client as c:
+            self.login(c, self.artist)
+            for _ in range(2):
+                resp = c.post(f'/trade/{trade.id}/accept',
+                              headers={'Idempotency-Key': 'accept-1'})
+                self.assertEqual(resp.location, '/dashboard')
+
+        self.assertEqual(db.session.get(ArtPiece, self.wanted.id).user_id, self.collector.id)
+        self.assertEqual(IdempotencyKey.query.one().response_status, 302)
+
+    def test_idempotency_key_in_progress(self):
+        """A retry while the first request is still running is refused."""
+
+        data = {'sender_art_id': self.collection[0].id, 'receiver_art_id': self.wanted.id}
+        with app.test_request_context('/trade/new', method='POST', data=data):
+            fingerprint = request_fingerprint()
+        db.session.add(IdempotencyKey(user_id=self.collector.id, key='busy',
+                                      fingerprint=fingerprint))
+        db.session.commit()
+
+        with self.client as c:
+            self.login(c, self.collector)
+            self.assertEqual(self.offer(c, headers={'Idempotency-Key': 'busy'}).status_code, 409)
+        self.assertEqual(Trade.query.count(), 0)
+
+    def make_offers(self, ages):
+        """Create pending offers created the given number of days ago."""
+
+        trades = [
+            Trade(sender_id=self.collector.id, receiver_id=self.artist.id,
+                  sender_art_id=self.collection[i].id, receiver_art_id=self.wanted.id,
+                  status='pending', created_at=datetime.utcnow() - timedelta(days=age))
+            for i, age in enumerate(ages)
+        ]
+        db.session.add_all(trades)
+        db.session.commit()
+        return trades
+
+    def test_expire_stale_trades(self):
+        """Only pending trades older than the TTL expire, in batches."""
+
+        trades = self.make_offers([30, 30, 30, 20, 1])
+        trades[0].status = 'accepted'
+        db.session.commit()
+
+        expired = expire_stale_trades(timedelta(days=14), batch_size=2)
+
+        self.assertEqual(expired, 3)
+        statuses = [db.session.get(Trade, trade.id) for trade in trades]
+        self.assertEqual([t.is_expired for t in statuses], [False, True, True, True, False])
+        self.assertEqual(statuses[-1].status, 'pending')
+
+    def test_scheduled_expiry(self):
+        """The expiry job sweeps and queues its next run."""
+
+        self.make_offers([30])
+        schedule_expiry()
+        db.session.commit()
+
+        work('test-worker', burst=True)
+
+        self.assertEqual(Trade.query.one().status, 'expired')
+        jobs = Job.query.order_by(Job.id).all()
+        self.assertEqual([job.status for job in jobs], ['done', 'queued'])
+        self.assertGreater(jobs[1].run_at, datetime.utcnow())